@@ -0,0 +1,188 @@
+import fnmatch
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from threading import Thread
+
+from profiler import short_path
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# allocations of imports and of the supervisors sampling the run, through
+# psutil, are not the model's
+_EXCLUDED = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, f"*{os.sep}psutil{os.sep}*"),
+] + [
+    tracemalloc.Filter(False, os.path.join(ROOT, module))
+    for module in [
+        "allocations.py",
+        "contention.py",
+        "cpu.py",
+        "loop_monitor.py",
+        "memory.py",
+        "profiler.py",
+        "runner.py",
+    ]
+]
+
+
+@dataclass(frozen=True)
+class AllocationSite:
+    location: str
+    size_bytes: int
+    count: int
+    size_diff_bytes: int = 0
+    count_diff: int = 0
+    traceback: list[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class AllocationUsage:
+    frame_depth: int
+    recording_interval: float
+    start_traced_bytes: int
+    end_traced_bytes: int
+    peak_traced_bytes: int
+    peak_snapshot_bytes: int
+    peak_snapshot_seconds: float
+    snapshot_count: int
+    top_sites: list[AllocationSite] = field(default_factory=list)
+    top_tracebacks: list[AllocationSite] = field(default_factory=list)
+    peak_diff: list[AllocationSite] = field(default_factory=list)
+    end_diff: list[AllocationSite] = field(default_factory=list)
+    sample_seconds: list[float] = field(default_factory=list)
+    traced_usage: list[int] = field(default_factory=list)
+    meaning: dict = field(default_factory=lambda: {
+        "frame_depth": "Frames tracemalloc kept per allocation, innermost first",
+        "peak_traced_bytes": "Most memory allocated by Python at once during the run, as tracemalloc counts it (not the RSS), the supervisors' included",
+        "peak_snapshot_bytes": "Traced memory of the snapshot closest to the peak, taken peak_snapshot_seconds after the start",
+        "top_sites": "Allocation sites by file and line holding the most memory in the peak snapshot",
+        "top_tracebacks": "The same by whole traceback, when frame_depth is above 1",
+        "peak_diff": "Sites whose memory grew the most from the start to the peak snapshot",
+        "end_diff": "Sites whose memory grew the most from the start to the end of the run, what it did not free",
+        "traced_usage": "Traced memory at sample_seconds since the start",
+    })
+
+
+def get_sites(stats: list, limit: int):
+    sites = []
+    for stat in stats[:limit]:
+        frames = [f"{short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+        sites.append(AllocationSite(
+            location=frames[0],
+            size_bytes=stat.size,
+            count=stat.count,
+            size_diff_bytes=getattr(stat, "size_diff", 0),
+            count_diff=getattr(stat, "count_diff", 0),
+            traceback=frames if len(frames) > 1 else [],
+        ))
+    return sites
+
+
+class AllocationSupervisor(Thread):
+    """
+    Traces the Python allocations of the run with tracemalloc, keeping
+    frame_depth frames of each. The traced memory is recorded every
+    interval, and a snapshot is taken each time it grows above the last
+    snapshot by more than peak_margin, so the last one is the closest
+    to the peak without paying a snapshot at every sample.
+
+    Tracing slows down every allocation, compare traced runs with traced
+    runs. Child processes are not traced.
+    """
+
+    def __init__(self, interval=0.5, frame_depth=1, top=20, peak_margin=0.1) -> None:
+        super().__init__(name="AllocationSupervisor", daemon=True)
+        self._interval = interval
+        self._frame_depth = frame_depth
+        self._top = top
+        self._peak_margin = peak_margin
+        self._keep_checking = True
+        self._start = 0.0
+        self._start_snapshot: tracemalloc.Snapshot|None = None
+        self._peak_snapshot: tracemalloc.Snapshot|None = None
+        self._end_snapshot: tracemalloc.Snapshot|None = None
+        self._peak_snapshot_bytes = 0
+        self._peak_snapshot_seconds = 0.0
+        self._start_traced = 0
+        self._end_traced = 0
+        self._peak_traced = 0
+        self.snapshot_count = 0
+        self.sample_seconds = []
+        self.traced_usage = []
+        self.cpu_seconds = 0.0
+
+    def _snapshot(self):
+        self.snapshot_count += 1
+        return tracemalloc.take_snapshot().filter_traces(_EXCLUDED)
+
+    def start(self):
+        # the filters match with fnmatch, which compiles and caches their
+        # patterns on first use, before tracing so that is not traced
+        for f in _EXCLUDED:
+            fnmatch.fnmatch("", f.filename_pattern)
+        # started from the measured thread, so the start snapshot is taken
+        # before the run allocates anything
+        tracemalloc.start(self._frame_depth)
+        self._start = time.perf_counter()
+        self._start_snapshot = self._snapshot()
+        self._start_traced = tracemalloc.get_traced_memory()[0]
+        super().start()
+
+    def _sample(self):
+        now = time.perf_counter()
+        traced, _ = tracemalloc.get_traced_memory()
+        self.sample_seconds.append(now - self._start)
+        self.traced_usage.append(traced)
+        if traced > self._peak_snapshot_bytes * (1 + self._peak_margin):
+            self._peak_snapshot = self._snapshot()
+            self._peak_snapshot_bytes = traced
+            self._peak_snapshot_seconds = now - self._start
+
+    def run(self) -> None:
+        start = time.thread_time()
+        while self._keep_checking:
+            self._sample()
+            time.sleep(self._interval)
+        # CPU time this sampling thread took from the measured process
+        self.cpu_seconds = time.thread_time() - start
+
+    def stop_checking(self):
+        self._keep_checking = False
+
+    def finish(self):
+        """Stop tracing, once the thread is joined."""
+        self._end_traced, self._peak_traced = tracemalloc.get_traced_memory()
+        self._end_snapshot = self._snapshot()
+        tracemalloc.stop()
+        if self._peak_snapshot is None or self._end_traced > self._peak_snapshot_bytes:
+            self._peak_snapshot = self._end_snapshot
+            self._peak_snapshot_bytes = self._end_traced
+            self._peak_snapshot_seconds = time.perf_counter() - self._start
+
+    def get_usage(self):
+        peak, start, end = self._peak_snapshot, self._start_snapshot, self._end_snapshot
+        return AllocationUsage(
+            frame_depth=self._frame_depth,
+            recording_interval=self._interval,
+            start_traced_bytes=self._start_traced,
+            end_traced_bytes=self._end_traced,
+            peak_traced_bytes=self._peak_traced,
+            peak_snapshot_bytes=self._peak_snapshot_bytes,
+            peak_snapshot_seconds=self._peak_snapshot_seconds,
+            snapshot_count=self.snapshot_count,
+            top_sites=get_sites(peak.statistics("lineno"), self._top),
+            top_tracebacks=(
+                get_sites(peak.statistics("traceback"), self._top)
+                if self._frame_depth > 1 else []
+            ),
+            peak_diff=get_sites(peak.compare_to(start, "lineno"), self._top),
+            end_diff=get_sites(end.compare_to(start, "lineno"), self._top),
+            sample_seconds=self.sample_seconds,
+            traced_usage=self.traced_usage,
+        )
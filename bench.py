@@ -0,0 +1,367 @@
+import argparse
+import importlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field, replace
+
+from lib import get_url_bytes, raise_fd_limit
+from pools import POOL_STRATEGIES
+from results import DB_PATH, ResultStore
+from runner import RunOptions, get_params, program_runner
+from server import bench_server
+from stats import get_path
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# matrix axes in the order they appear in run names
+AXES = [
+    "url_count",
+    "concurrency",
+    "threads",
+    "processes",
+    "pool",
+    "pipeline",
+    "sink",
+    "stream",
+    "switch_interval",
+]
+
+
+@dataclass(frozen=True)
+class Model:
+    module: str
+    fn: str = "main"
+    # matrix axis -> keyword argument of fn, axes missing here do not apply
+    params: dict = field(default_factory=dict)
+    # keyword arguments always passed to fn
+    fixed: dict = field(default_factory=dict)
+    # matrix axis -> RunOptions field, for the settings of the interpreter
+    # rather than of the model
+    options: dict = field(default_factory=dict)
+
+    @property
+    def workload(self):
+        return self.module.split(".")[0]
+
+    def get_kwargs(self, cell: dict):
+        kwargs = dict(self.fixed)
+        for axis, param in self.params.items():
+            if axis in cell:
+                kwargs[param] = cell[axis]
+        return kwargs
+
+    def get_options(self, cell: dict):
+        return {
+            option: cell[axis]
+            for axis, option in self.options.items()
+            if axis in cell
+        }
+
+
+MODELS = {
+    "cpu-bound.sync": Model(
+        "cpu-bound.sync",
+        params={"url_count": "url_count"},
+    ),
+    "cpu-bound.asyncio": Model(
+        "cpu-bound.asyncio",
+        "execute",
+        params={"url_count": "url_count"},
+    ),
+    "cpu-bound.thread": Model(
+        "cpu-bound.thread",
+        params={"url_count": "url_count", "threads": "thread_count"},
+        options={"switch_interval": "switch_interval"},
+    ),
+    "cpu-bound.process": Model(
+        "cpu-bound.process",
+        params={"url_count": "url_count", "processes": "process_count"},
+    ),
+    "io-bound.sync": Model(
+        "io-bound.sync",
+        params={
+            "url_count": "url_count",
+            "pipeline": "pipeline",
+            "sink": "sink",
+            "stream": "stream",
+        },
+    ),
+    "io-bound.thread": Model(
+        "io-bound.thread",
+        params={
+            "url_count": "url_count",
+            "threads": "thread_count",
+            "pool": "pool",
+            "pipeline": "pipeline",
+            "sink": "sink",
+            "stream": "stream",
+        },
+        options={"switch_interval": "switch_interval"},
+    ),
+    "io-bound.asyncio": Model(
+        "io-bound.asyncio",
+        "execute",
+        params={"url_count": "url_count", "sink": "sink", "stream": "stream"},
+        fixed={"mode": "gather"},
+    ),
+    "io-bound.asyncio_stream": Model(
+        "io-bound.asyncio",
+        "execute",
+        params={
+            "url_count": "url_count",
+            "concurrency": "window",
+            "sink": "sink",
+            "stream": "stream",
+        },
+        fixed={"mode": "stream"},
+    ),
+    "io-bound.asyncio_protocol": Model(
+        "io-bound.asyncio_protocol",
+        "execute",
+        params={
+            "url_count": "url_count",
+            "concurrency": "window",
+            "sink": "sink",
+            "stream": "stream",
+        },
+    ),
+    "io-bound.thread_plus_asyncio": Model(
+        "io-bound.thread_plus_asyncio",
+        params={
+            "url_count": "url_count",
+            "threads": "thread_count",
+            "sink": "sink",
+            "stream": "stream",
+        },
+        options={"switch_interval": "switch_interval"},
+    ),
+    "io-bound.process_plus_asyncio": Model(
+        "io-bound.process_plus_asyncio",
+        params={
+            "url_count": "url_count",
+            "processes": "process_count",
+            "sink": "sink",
+            "stream": "stream",
+        },
+    ),
+}
+
+
+def expand_matrix(models: list[str], axes: dict[str, list]):
+    # an axis a model does not take is dropped for that model instead of
+    # running the same configuration once per value
+    cells = []
+    for name in models:
+        model = MODELS[name]
+        used = [
+            axis for axis in AXES
+            if axes.get(axis) and (axis in model.params or axis in model.options)
+        ]
+        for values in itertools.product(*[axes[axis] for axis in used]):
+            cells.append({"model": name, **dict(zip(used, values))})
+    return cells
+
+
+def get_cell_key(cell: dict):
+    return json.dumps(cell, sort_keys=True)
+
+
+def get_cell_name(cell: dict):
+    parts = [cell["model"].split(".")[1]]
+    for axis in AXES:
+        if axis in cell:
+            parts.append(f"{axis}_{cell[axis]}")
+    return "_".join(parts)
+
+
+def load_checkpoint(path: str):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f))
+
+
+def save_checkpoint(path: str, done: set):
+    # write then rename so an interrupted sweep never leaves half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(sorted(done), f, indent=4)
+    os.replace(tmp, path)
+
+
+def check_work(cell: dict, params: dict, data: dict, result):
+    # every model must do the same work for a url count, whatever its split
+    url_count = params["url_count"]
+    if MODELS[cell["model"]].workload == "cpu-bound":
+        expected = get_url_bytes(url_count)
+        if result != expected:
+            raise AssertionError(
+                f"{cell['model']} counted {result} bytes for {url_count} urls, sync counts {expected}"
+            )
+        return
+    # response bodies echo the client headers so byte totals differ between
+    # http clients, the number of requests made does not
+    done = get_path(data, "model_metrics.latency.total.count") + result[1]
+    if done != url_count:
+        raise AssertionError(
+            f"{cell['model']} made {done} requests for {url_count} urls"
+        )
+
+
+def run_cell(cell: dict, results: str, run_options: RunOptions):
+    raise_fd_limit()
+    model = MODELS[cell["model"]]
+    fn = getattr(importlib.import_module(model.module), model.fn)
+    kwargs = model.get_kwargs(cell)
+    run_options = replace(run_options, **model.get_options(cell))
+    with ResultStore(results) as store:
+        data, result = program_runner(
+            fn,
+            get_cell_name(cell),
+            model.workload,
+            run_options=run_options,
+            model=cell["model"],
+            store=store,
+            descr=f"Sweep cell of {cell['model']} with {get_cell_key(cell)}. See the model module for the experiment.",
+            **kwargs,
+        )
+    check_work(cell, get_params(fn, kwargs), data, result)
+
+
+def run_matrix(
+    cells: list[dict],
+    results: str,
+    checkpoint: str,
+    run_options: RunOptions,
+    resume=False,
+):
+    done = load_checkpoint(checkpoint) if resume else set()
+    failed = []
+
+    with bench_server():
+        for i, cell in enumerate(cells):
+            key = get_cell_key(cell)
+            if key in done:
+                print(f"[{i + 1}/{len(cells)}] {key} already done, skipped")
+                continue
+
+            print(f"[{i + 1}/{len(cells)}] {key}")
+            # a fresh interpreter per cell, so no memory or warmed up state
+            # carries over from the previous run
+            proc = subprocess.run(
+                [
+                    sys.executable, "-m", "bench", "cell", key,
+                    "--results", results,
+                    "--run-options", json.dumps(asdict(run_options)),
+                ],
+                cwd=ROOT,
+            )
+            if proc.returncode != 0:
+                print(f"{key} failed with exit code {proc.returncode}")
+                failed.append(cell)
+                continue
+
+            done.add(key)
+            save_checkpoint(checkpoint, done)
+
+    return failed
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m bench",
+        description="Run a matrix of benchmark configurations, each in a fresh process.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List the models and the axes they take")
+
+    run = commands.add_parser("run", help="Expand and run a matrix")
+    run.add_argument("--models", nargs="+", choices=list(MODELS), help="Default: every model of the selected workloads")
+    run.add_argument("--workloads", nargs="+", choices=["cpu-bound", "io-bound"], default=["cpu-bound", "io-bound"])
+    run.add_argument("--url-counts", nargs="+", type=int, dest="url_count")
+    run.add_argument("--concurrency", nargs="+", type=int, help="In flight requests of the asyncio stream and protocol models")
+    run.add_argument("--threads", nargs="+", type=int)
+    run.add_argument("--processes", nargs="+", type=int)
+    run.add_argument("--pools", nargs="+", dest="pool", choices=POOL_STRATEGIES, help="Connection pool strategy of the io-bound thread model")
+    run.add_argument("--pipeline", nargs="+", type=int, help="Requests per pipelined batch of the io-bound sync and thread models, 0 for requests")
+    run.add_argument("--sinks", nargs="+", dest="sink")
+    run.add_argument("--stream", nargs="+", type=lambda v: v.lower() in ("1", "true", "yes"))
+    run.add_argument("--switch-intervals", nargs="+", type=float, dest="switch_interval", help="sys.setswitchinterval in seconds for the thread based models")
+    run.add_argument("--results", default=DB_PATH, help="Results store, see results.py")
+    run.add_argument("--checkpoint", default=os.path.join(ROOT, "results", "checkpoint.json"))
+    run.add_argument("--resume", action="store_true", help="Skip the cells the checkpoint marks as done")
+    run.add_argument("--dry-run", action="store_true", help="Print the cells without running them")
+    run.add_argument("--sampling", choices=["thread", "process"], default="thread")
+    run.add_argument("--sampling-interval", type=float, default=0.5)
+    run.add_argument("--warmup-runs", type=int, default=0)
+    run.add_argument("--trials", type=int, default=1)
+    run.add_argument("--cooldown-seconds", type=float, default=0)
+    run.add_argument("--contention", action="store_true", help="Record context switches, per thread CPU time and lock waits")
+    run.add_argument("--loop-monitor", action="store_true", help="Record event loop lag and slow callbacks of the asyncio models")
+    run.add_argument("--slow-callback-seconds", type=float, default=0.01)
+    run.add_argument("--profile-rate", type=float, default=0, help="Stack samples per second, writes folded stacks under results/profiles")
+    run.add_argument("--profile-idle", action="store_true", help="Keep the stack samples of threads not using the CPU")
+    run.add_argument("--tracemalloc-frames", type=int, default=0, help="Trace allocations with tracemalloc keeping this many frames of each")
+
+    cell = commands.add_parser("cell", help="Run a single cell, used by run")
+    cell.add_argument("cell", type=json.loads)
+    cell.add_argument("--results", required=True)
+    cell.add_argument("--run-options", type=json.loads, default={})
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+
+    if args.command == "list":
+        for name, model in MODELS.items():
+            print(f"{name:<32}{', '.join([*model.params, *model.options])}")
+        return 0
+
+    if args.command == "cell":
+        run_cell(args.cell, args.results, RunOptions(**args.run_options))
+        return 0
+
+    models = args.models or [
+        name for name, model in MODELS.items() if model.workload in args.workloads
+    ]
+    cells = expand_matrix(models, {axis: getattr(args, axis) for axis in AXES})
+    if args.dry_run:
+        for cell in cells:
+            print(get_cell_key(cell))
+        return 0
+
+    for path in (args.results, args.checkpoint):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    run_options = RunOptions(
+        sampling=args.sampling,
+        sampling_interval=args.sampling_interval,
+        warmup_runs=args.warmup_runs,
+        trials=args.trials,
+        cooldown_seconds=args.cooldown_seconds,
+        contention=args.contention,
+        loop_monitor=args.loop_monitor,
+        slow_callback_seconds=args.slow_callback_seconds,
+        profile_rate=args.profile_rate,
+        profile_idle=args.profile_idle,
+        tracemalloc_frames=args.tracemalloc_frames,
+    )
+    failed = run_matrix(
+        cells,
+        os.path.abspath(args.results),
+        os.path.abspath(args.checkpoint),
+        run_options,
+        args.resume,
+    )
+    print(f"{len(cells) - len(failed)}/{len(cells)} cells done")
+    for cell in failed:
+        print("failed:", get_cell_key(cell))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
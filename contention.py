@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from threading import Thread
+
+import psutil
+
+
+@dataclass(frozen=True)
+class LockUsage:
+    name: str
+    lock_count: int
+    acquire_count: int
+    contended_count: int
+    wait_seconds: float
+    max_wait_seconds: float
+
+
+@dataclass(frozen=True)
+class ThreadUsage:
+    name: str
+    native_id: int
+    cpu_seconds: float
+    wall_seconds: float
+    cpu_ratio: float
+
+
+@dataclass(frozen=True)
+class ContentionUsage:
+    recording_interval: float
+    max_thread_count: int
+    voluntary_ctx_switches: int
+    involuntary_ctx_switches: int
+    ctx_switches_per_second: float
+    thread_cpu_seconds: float
+    thread_wall_seconds: float
+    cpu_ratio: float
+    lock_wait_seconds: float
+    sampler_cpu_seconds: float
+    sample_seconds: list[float] = field(default_factory=list)
+    voluntary_usage: list[int] = field(default_factory=list)
+    involuntary_usage: list[int] = field(default_factory=list)
+    thread_count_usage: list[int] = field(default_factory=list)
+    threads: list[ThreadUsage] = field(default_factory=list)
+    locks: list[LockUsage] = field(default_factory=list)
+    meaning: dict = field(default_factory=lambda: {
+        "voluntary_ctx_switches": "Times a thread of the process gave up the CPU to wait (IO, a lock, the GIL handoff), over the run",
+        "involuntary_ctx_switches": "Times the OS took the CPU from a runnable thread of the process, over the run",
+        "thread_cpu_seconds": "CPU time of the threads the run started, summed",
+        "thread_wall_seconds": "Time those threads were alive, summed",
+        "cpu_ratio": "thread_cpu_seconds / thread_wall_seconds, what is left was spent waiting: on the GIL, a lock or the network",
+        "lock_wait_seconds": "Time threads waited on the instrumented locks of the benchmark, summed over locks",
+        "voluntary_usage": "Voluntary context switches during each recording interval, at sample_seconds since the start",
+        "threads": "CPU and wall time of every thread seen during the run",
+        "locks": "Instrumented locks by name, lock_count of them created during the run",
+    })
+
+
+class InstrumentedLock:
+    """
+    threading.Lock that times how long acquire waits when the lock is
+    taken. An uncontended acquire costs one extra non blocking attempt.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self.acquire_count = 0
+        self.contended_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        _register(self)
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.acquire_count += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        wait = time.perf_counter() - start
+        if acquired:
+            # counted while holding the lock, no other writer
+            self.acquire_count += 1
+            self.contended_count += 1
+            self.wait_seconds += wait
+            if wait > self.max_wait_seconds:
+                self.max_wait_seconds = wait
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# locks created while a profile runs, see ContentionSupervisor
+_profiled_locks: list[InstrumentedLock]|None = None
+_profiled_locks_lock = threading.Lock()
+
+
+def _register(lock: InstrumentedLock):
+    with _profiled_locks_lock:
+        if _profiled_locks is not None:
+            _profiled_locks.append(lock)
+
+
+def make_lock(name: str):
+    """
+    An InstrumentedLock named name while a contention profile runs, a plain
+    threading.Lock otherwise, so runs not profiled pay nothing for the
+    instrumentation. Models create their locks inside the measured run.
+    """
+    if _profiled_locks is None:
+        return threading.Lock()
+    return InstrumentedLock(name)
+
+
+def get_lock_usages(locks: list[InstrumentedLock]):
+    by_name: dict[str, list[InstrumentedLock]] = {}
+    for lock in locks:
+        by_name.setdefault(lock.name, []).append(lock)
+    return [
+        LockUsage(
+            name=name,
+            lock_count=len(same),
+            acquire_count=sum(l.acquire_count for l in same),
+            contended_count=sum(l.contended_count for l in same),
+            wait_seconds=sum(l.wait_seconds for l in same),
+            max_wait_seconds=max(l.max_wait_seconds for l in same),
+        )
+        for name, same in sorted(by_name.items())
+    ]
+
+
+def _read_task_ctx_switches():
+    """(voluntary, involuntary) context switches by native thread id."""
+    switches = {}
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        return None
+    for tid in tids:
+        voluntary = involuntary = 0
+        try:
+            with open(f"/proc/self/task/{tid}/status", "rb") as f:
+                for line in f:
+                    if line.startswith(b"voluntary_ctxt_switches"):
+                        voluntary = int(line.split()[1])
+                    elif line.startswith(b"nonvoluntary_ctxt_switches"):
+                        involuntary = int(line.split()[1])
+        except OSError:
+            # the thread ended meanwhile
+            continue
+        switches[int(tid)] = (voluntary, involuntary)
+    return switches
+
+
+class ContentionSupervisor(Thread):
+    """
+    Samples the context switches of the process and the CPU time of each
+    Python thread started after it every interval, and collects the usage
+    of the InstrumentedLock created while it runs. Per thread CPU time
+    against the time the thread was alive shows how much of its life it
+    waited.
+    """
+
+    _proc = psutil.Process()
+
+    def __init__(self, interval=0.1) -> None:
+        super().__init__(name="ContentionSupervisor", daemon=True)
+        self._keep_checking = True
+        self._interval = interval
+        self._start = 0.0
+        self._last_ctx = (0, 0)
+        self._first_ctx = (0, 0)
+        # native id -> last (voluntary, involuntary) seen, ended threads
+        # keep theirs so the process total does not go back
+        self._task_ctx: dict[int, tuple[int, int]] = {}
+        self.sample_seconds = []
+        self.voluntary_usage = []
+        self.involuntary_usage = []
+        self.thread_count_usage = []
+        # native id -> [name, first seen, last seen, cpu seconds]
+        self._threads: dict[int, list] = {}
+        # the main thread and the other supervisors are not the run's
+        self._ignored: set[int] = set()
+        self.cpu_seconds = 0.0
+        self._locks: list[InstrumentedLock] = []
+
+    def start(self):
+        global _profiled_locks
+        with _profiled_locks_lock:
+            _profiled_locks = self._locks
+        self._ignored = {t.native_id for t in threading.enumerate()}
+        self._start = time.perf_counter()
+        self._first_ctx = self._last_ctx = self._read_ctx_switches()
+        super().start()
+
+    def _read_ctx_switches(self):
+        # psutil reads the counters of the main thread only on Linux, the
+        # ones of every thread are summed from /proc when it is there
+        switches = _read_task_ctx_switches()
+        if switches is None:
+            ctx = self._proc.num_ctx_switches()
+            return ctx.voluntary, ctx.involuntary
+        self._task_ctx.update(switches)
+        return (
+            sum(v for v, _ in self._task_ctx.values()),
+            sum(i for _, i in self._task_ctx.values()),
+        )
+
+    def _sample(self):
+        now = time.perf_counter()
+        ctx = self._read_ctx_switches()
+        self.sample_seconds.append(now - self._start)
+        self.voluntary_usage.append(ctx[0] - self._last_ctx[0])
+        self.involuntary_usage.append(ctx[1] - self._last_ctx[1])
+        self._last_ctx = ctx
+
+        try:
+            cpu_times = {
+                t.id: t.user_time + t.system_time for t in self._proc.threads()
+            }
+        except psutil.Error:
+            cpu_times = {}
+        python_threads = [
+            t for t in threading.enumerate()
+            if t.native_id is not None
+            and t.native_id not in self._ignored
+            and t is not self
+        ]
+        self.thread_count_usage.append(len(python_threads))
+        for t in python_threads:
+            if t.native_id not in cpu_times:
+                continue
+            seen = self._threads.setdefault(t.native_id, [t.name, now, now, 0.0])
+            seen[2] = now
+            seen[3] = cpu_times[t.native_id]
+
+    def run(self) -> None:
+        start = time.thread_time()
+        while self._keep_checking:
+            self._sample()
+            time.sleep(self._interval)
+        self._sample()
+        # CPU time this sampling thread took from the measured process
+        self.cpu_seconds = time.thread_time() - start
+
+    def stop_checking(self):
+        global _profiled_locks
+        self._keep_checking = False
+        with _profiled_locks_lock:
+            _profiled_locks = None
+
+    def get_usage(self):
+        elapsed = self.sample_seconds[-1] if self.sample_seconds else 0.0
+        voluntary = self._last_ctx[0] - self._first_ctx[0]
+        involuntary = self._last_ctx[1] - self._first_ctx[1]
+        threads = [
+            ThreadUsage(
+                name=name,
+                native_id=native_id,
+                cpu_seconds=cpu,
+                # a thread lives up to one interval before its first sample
+                # and after its last one, half of each is the best guess
+                wall_seconds=last - first + self._interval,
+                cpu_ratio=cpu / (last - first + self._interval),
+            )
+            for native_id, (name, first, last, cpu) in self._threads.items()
+        ]
+        cpu_seconds = sum(t.cpu_seconds for t in threads)
+        wall_seconds = sum(t.wall_seconds for t in threads)
+        locks = get_lock_usages(self._locks)
+        return ContentionUsage(
+            recording_interval=self._interval,
+            max_thread_count=max(self.thread_count_usage, default=0),
+            voluntary_ctx_switches=voluntary,
+            involuntary_ctx_switches=involuntary,
+            ctx_switches_per_second=(voluntary + involuntary) / elapsed if elapsed else 0.0,
+            thread_cpu_seconds=cpu_seconds,
+            thread_wall_seconds=wall_seconds,
+            cpu_ratio=cpu_seconds / wall_seconds if wall_seconds else 0.0,
+            lock_wait_seconds=sum(l.wait_seconds for l in locks),
+            sampler_cpu_seconds=self.cpu_seconds,
+            sample_seconds=self.sample_seconds,
+            voluntary_usage=self.voluntary_usage,
+            involuntary_usage=self.involuntary_usage,
+            thread_count_usage=self.thread_count_usage,
+            threads=threads,
+            locks=locks,
+        )
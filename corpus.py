@@ -0,0 +1,130 @@
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from lib import URL_VERSION, generate_valid_paths
+
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "bench-corpus")
+
+# magic, url count, position of the offset index
+_HEADER = struct.Struct("<8sQQ")
+_MAGIC = b"URLPATH1"
+
+
+def build_corpus(path: str, url_count: int):
+    """
+    Write the paths of the first url_count urls to path: a header, the
+    path bytes back to back, then url_count + 1 uint64 offsets so path i
+    is data[offsets[i]:offsets[i + 1]]. Paths do not depend on the server,
+    one file serves every server address.
+    """
+    offsets = array("Q", [_HEADER.size])
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        for url_path in generate_valid_paths(url_count):
+            encoded = url_path.encode()
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+        index_offset = offsets[-1]
+        offsets.tofile(f)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, url_count, index_offset))
+    # workers racing to build the same corpus all end up with a whole file
+    os.replace(tmp, path)
+    return path
+
+
+class UrlCorpus:
+    """
+    Read only, memory-mapped view of a corpus file. Opening it costs the
+    same whatever its size, paths are sliced out of the mapping as
+    memoryviews that stay valid until close, and urls are those paths on
+    the server of BENCH_SERVER_URL.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        base_url = os.getenv("BENCH_SERVER_URL", None)
+        if base_url is None:
+            raise Exception(
+                f"Please provide the httpbin server base url as env variable to the process with key: BENCH_SERVER_URL"
+            )
+        self._prefix = f"http://{base_url}"
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.url_count, index_offset = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a url corpus")
+        self._buffer = memoryview(self._mmap)
+        self._offsets = self._buffer[
+            index_offset:index_offset + 8 * (self.url_count + 1)
+        ].cast("Q")
+
+    def __len__(self):
+        return self.url_count
+
+    def view(self, i: int):
+        """Path of url i."""
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]]
+
+    def url(self, i: int):
+        return self._prefix + str(self.view(i), "ascii")
+
+    def urls(self, start=0, stop=None):
+        stop = self.url_count if stop is None else min(stop, self.url_count)
+        prefix = self._prefix
+        for i in range(start, stop):
+            yield prefix + str(self._buffer[self._offsets[i]:self._offsets[i + 1]], "ascii")
+
+    def close(self):
+        self._offsets.release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_corpus_path(url_count: int):
+    return os.path.join(CORPUS_DIR, f"paths_{url_count}_v{URL_VERSION}.bin")
+
+
+def _remove_stale(url_count: int, keep: str):
+    # corpora of older url versions, and the per server address ones of
+    # before paths, are never read again. Unlinking a file a running
+    # process maps is safe, the mapping stays valid
+    for name in os.listdir(CORPUS_DIR):
+        path = os.path.join(CORPUS_DIR, name)
+        if path == keep or not name.endswith(".bin"):
+            continue
+        if name.startswith(f"paths_{url_count}_v") or name.startswith("urls_"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def ensure_corpus(url_count: int):
+    """Path of the corpus of the first url_count urls, built if missing."""
+    path = get_corpus_path(url_count)
+    if not os.path.exists(path):
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        build_corpus(path, url_count)
+        _remove_stale(url_count, path)
+    return path
+
+
+def open_corpus(url_count: int):
+    """
+    Open the corpus of the first url_count urls, built on first use. The
+    models build it in their prepare instead, so the build is not part of
+    a measured run (see runner.program_runner).
+    """
+    return UrlCorpus(ensure_corpus(url_count))
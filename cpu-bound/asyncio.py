@@ -1,6 +1,7 @@
 import asyncio
 
 from lib import generate_valid_urls, get_dir_name
+from loop_monitor import monitor_loop
 from runner import program_runner
 
 
@@ -11,17 +12,19 @@ async def count_char_bytes(url:str):
         char_bytes += len(char.encode())
     return char_bytes
 
-async def main():
+async def main(url_count=1_00_000):
     total_bytes = 0
-    for url in generate_valid_urls(1_00_000):
-        total_bytes += await count_char_bytes(url)
+    # nothing here yields to the loop, the lag is the whole run
+    with monitor_loop():
+        for url in generate_valid_urls(url_count):
+            total_bytes += await count_char_bytes(url)
     return total_bytes
 
+def execute(url_count=1_00_000):
+    return asyncio.run(main(url_count))
 
-if __name__ == "__main__":
-    def execute():
-        return asyncio.run(main())
 
+if __name__ == "__main__":
     program_runner(
         execute,
         "asyncio_data",
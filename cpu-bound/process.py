@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from lib import generate_valid_urls, get_dir_name, get_url_bytes, shard
+from results import DB_PATH, ResultStore
+from runner import RunOptions, get_baseline_params, program_runner, report_metric
+
+CHUNKS_PER_PROCESS = 4
+
+# url count -> elapsed of the sync model over them, looked up by prepare
+_sync_elapsed: dict[int, float|None] = {}
+
+
+@dataclass(frozen=True)
+class SpeedupUsage:
+    sync_elapsed_seconds: float
+    pool_elapsed_seconds: float
+    speedup: float
+    parallel_efficiency: float
+    meaning: dict = field(default_factory=lambda: {
+        "sync_elapsed_seconds": "Elapsed time of the latest baseline cpu-bound.sync run over the same urls",
+        "pool_elapsed_seconds": "Time main took, from creating the pool to summing the chunks",
+        "speedup": "sync_elapsed_seconds / pool_elapsed_seconds",
+        "parallel_efficiency": "speedup / process_count, 1 when the pool runs process_count times faster than sync",
+    })
+
+
+def count_urls_char_bytes(start: int, stop: int):
+    # each worker generates its own slice instead of receiving pickled urls
+    char_bytes = 0
+    for url in generate_valid_urls(start, stop):
+        for char in url:
+            char_bytes += len(char.encode())
+    return char_bytes
+
+
+def prepare(url_count=1_00_000, results_path=DB_PATH, **params):
+    # run by program_runner before the measured runs, the store is not
+    # read during them
+    _sync_elapsed[url_count] = get_sync_elapsed(url_count, results_path)
+
+
+def main(process_count=4, chunks_per_process=CHUNKS_PER_PROCESS, url_count=1_00_000):
+    start = time.perf_counter()
+    chunk_count = process_count * chunks_per_process
+    chunks = [
+        (start, stop) for start, stop in
+        (shard(k, chunk_count, url_count) for k in range(chunk_count))
+        if stop > start
+    ]
+
+    with ProcessPoolExecutor(max_workers=process_count) as executor:
+        total_bytes = sum(
+            executor.map(
+                count_urls_char_bytes,
+                *zip(*chunks)
+            )
+        )
+
+    elapsed = time.perf_counter() - start
+    sync_elapsed = _sync_elapsed.get(url_count)
+    if sync_elapsed is not None:
+        speedup = sync_elapsed / elapsed
+        report_metric("speedup", SpeedupUsage(
+            sync_elapsed_seconds=sync_elapsed,
+            pool_elapsed_seconds=elapsed,
+            speedup=speedup,
+            parallel_efficiency=speedup / process_count,
+        ))
+
+    return total_bytes
+
+
+def get_sync_elapsed(url_count=1_00_000, results_path=DB_PATH):
+    with ResultStore(results_path) as store:
+        run = store.get_latest(
+            model="cpu-bound.sync", params=get_baseline_params(url_count=url_count)
+        )
+    return run.elapsed_seconds if run is not None else None
+
+
+if __name__ == "__main__":
+    dir_name = get_dir_name(__file__)
+    if get_sync_elapsed() is None:
+        print("No sync result found, run cpu-bound.sync first to get speedup")
+
+    expected_bytes = get_url_bytes(1_00_000)
+    for i in range(2, 11, 2):
+        data, total_bytes = program_runner(
+            main,
+            f"{i}_processes_data",
+            dir_name,
+            run_options=RunOptions(cooldown_seconds=0.8),
+            descr=f"Cpu bound execution with a pool of {i} processes. The experiment count bytes per characteres for 1_00_000 generated urls split into {i * CHUNKS_PER_PROCESS} chunks, each worker generates its own slice of urls. The returned_value represents the total bytes of the operation.",
+            process_count=i,
+            chunks_per_process=CHUNKS_PER_PROCESS,
+        )
+        assert total_bytes == expected_bytes, (
+            f"{i} processes counted {total_bytes} bytes, sync counts {expected_bytes}"
+        )
+        speedup = data["model_metrics"].get("speedup")
+        if speedup is not None:
+            print(
+                f"{i} processes: speedup {speedup['speedup']:.2f}x,",
+                f"parallel efficiency {speedup['parallel_efficiency']:.2%}"
+            )
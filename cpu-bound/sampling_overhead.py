@@ -0,0 +1,54 @@
+from statistics import mean
+
+from lib import get_dir_name
+from runner import RunOptions, program_runner
+
+from .sync import main
+
+
+SAMPLINGS = [
+    RunOptions(sampling="thread", sampling_interval=0.5, cooldown_seconds=0.8),
+    RunOptions(sampling="thread", sampling_interval=0.01, cooldown_seconds=0.8),
+    RunOptions(sampling="process", sampling_interval=0.5, cooldown_seconds=0.8),
+    RunOptions(sampling="process", sampling_interval=0.01, cooldown_seconds=0.8),
+]
+
+
+def get_name(options: RunOptions):
+    return f"sync_data_{options.sampling}_sampling_every_{options.sampling_interval}s"
+
+
+def compare(repeats=3):
+    results = {options: [] for options in SAMPLINGS}
+    # interleave the modes so host noise hits all of them alike
+    for _ in range(repeats):
+        for options in SAMPLINGS:
+            data, _ = program_runner(
+                main,
+                get_name(options),
+                get_dir_name(__file__),
+                run_options=options,
+                # sync runs sampled otherwise are not the baseline of the
+                # speedups and plots
+                model="cpu-bound.sampling_overhead",
+                descr=f"Cpu bound execution in traditional sync mode, sampled by {options.sampling} every {options.sampling_interval}s to measure the sampling overhead. The experiment count bytes per characteres for 1_00_000 generated urls. The returned_value represents the total bytes of the operation.",
+            )
+            results[options].append(data)
+    return results
+
+
+if __name__ == "__main__":
+    results = compare()
+    baseline = min(
+        mean(d["elapsed_seconds"] for d in runs) for runs in results.values()
+    )
+
+    print(f"\n{'sampling':<10}{'interval':>10}{'elapsed':>12}{'overhead':>11}{'sampler cpu':>14}{'samples':>10}")
+    for options, runs in results.items():
+        elapsed = mean(d["elapsed_seconds"] for d in runs)
+        sampler_cpu = mean(d["sampling"]["sampler_cpu_seconds"] for d in runs)
+        samples = mean(len(d["cpu"]["proc_usage"]) for d in runs)
+        print(
+            f"{options.sampling:<10}{options.sampling_interval:>9}s{elapsed:>11.3f}s"
+            f"{elapsed / baseline - 1:>+11.1%}{sampler_cpu:>13.3f}s{samples:>10.0f}"
+        )
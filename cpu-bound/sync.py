@@ -9,9 +9,9 @@ def count_char_bytes(url:str):
         char_bytes += len(char.encode())
     return char_bytes
 
-def main():
+def main(url_count=1_00_000):
     total_bytes = 0
-    for url in generate_valid_urls(1_00_000):
+    for url in generate_valid_urls(url_count):
         total_bytes += count_char_bytes(url)
     return total_bytes
 
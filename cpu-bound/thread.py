@@ -1,28 +1,27 @@
-import time
 from threading import Thread
 from queue import Queue
 
-from lib import generate_valid_urls, get_dir_name
-from runner import program_runner
+from lib import generate_valid_urls, get_dir_name, get_url_bytes, shard
+from runner import RunOptions, program_runner
 
 
-def count_urls_char_bytes(url_count: int, q:Queue):
+def count_urls_char_bytes(start: int, stop: int, q:Queue):
     char_bytes = 0
-    for url in generate_valid_urls(url_count):
+    for url in generate_valid_urls(start, stop):
         for char in url:
             char_bytes += len(char.encode())
     q.put(char_bytes)
 
-def main(thread_count=4):
-    url_total = 1_00_000
+def main(thread_count=4, url_count=1_00_000):
     threads = []
     q = Queue()
     total_bytes = 0
 
-    for _ in range(thread_count):
+    # each thread counts its own slice of the urls sync.py counts
+    for k in range(thread_count):
         t = Thread(
                 target=count_urls_char_bytes, 
-                args=(url_total//thread_count, q)
+                args=(*shard(k, thread_count, url_count), q)
         )
         t.start()
         threads.append(t)
@@ -37,14 +36,18 @@ def main(thread_count=4):
 
 
 if __name__ == "__main__":
+    expected_bytes = get_url_bytes(1_00_000)
     for i in range(2, 11, 2):
-        program_runner(
+        _, total_bytes = program_runner(
             main,
             f"{i}_threads_data",
             get_dir_name(__file__),
+            run_options=RunOptions(cooldown_seconds=0.8),
             descr=f"Cpu bound execution with {i} Threads. The experiment count bytes per characteres for 1_00_000 generated urls. The returned_value represents the total bytes of the operation.",
             thread_count=i
         )
-        time.sleep(0.8)
+        assert total_bytes == expected_bytes, (
+            f"{i} threads counted {total_bytes} bytes, sync counts {expected_bytes}"
+        )
 
 
@@ -4,6 +4,8 @@ from dataclasses import dataclass, field
 
 import psutil
 
+from profiler import StackProfiler
+
 
 @dataclass(frozen=True)
 class CpuUsage:
@@ -16,10 +18,14 @@ class CpuUsage:
     recording_interval: float
     sys_usage: list[float] = field(default_factory=list)
     proc_usage: list[float] = field(default_factory=list)
+    children_usage: dict = field(default_factory=dict)
+    thread_times: dict = field(default_factory=dict)
     core_count: int|None = field(default=psutil.cpu_count(logical=True))
     meaning: dict = field(default_factory=lambda: {
-            "proc": "Stands for process, the process in which the program is running ",
+            "proc": "Stands for process, the process in which the program is running plus every child process it started during the run",
             "sys": "Stands for system, the whole system",
+            "children_usage": "CPU usage of each child process by pid, first_sample is the index of proc_usage where it was first seen",
+            "thread_times": "Last seen user and system CPU time in second of each thread, by pid then thread id, read every thread_times_every records and at the end, so threads living less than that can be missing",
             "recording_interval": "Time in second between CPU usage record"
     })
 
@@ -28,20 +34,107 @@ class CpuSupervisor(Thread):
     _proc = psutil.Process()
     _pst = psutil
 
-    def __init__(self, interval=0.5) -> None:
+    def __init__(
+        self,
+        interval=0.5,
+        proc: psutil.Process|None = None,
+        profiler: StackProfiler|None = None,
+        thread_times_every=10,
+    ) -> None:
         super().__init__()
+        if proc is not None:
+            self._proc = proc
+        # ticked faster than interval when given, stacks are sampled at
+        # every tick and CPU usage every interval
+        self._profiler = profiler
+        # listing the threads of a process costs ~20ms at 1000 threads,
+        # taken from the measured process, so not at every record
+        self._thread_times_every = thread_times_every
         self._keep_checking = True
         self._interval = interval
         self.sys_wide_usage = []
         self.proc_usage = []
+        self.children_usage = {}
+        self.thread_times = {}
+        self._children: dict[int, psutil.Process] = {}
+        self._ignored = set()
+        self.cpu_seconds = 0.0
+
+    def _refresh_children(self):
+        try:
+            children = self._proc.children(recursive=True)
+        except psutil.Error:
+            return
+        for child in children:
+            if child.pid in self._ignored or child.pid in self._children:
+                continue
+            try:
+                child.cpu_percent(interval=None)
+            except psutil.Error:
+                continue
+            self._children[child.pid] = child
+            self.children_usage[child.pid] = {
+                "first_sample": len(self.proc_usage),
+                "usage": [],
+            }
+
+    def _record_threads(self, proc: psutil.Process):
+        try:
+            threads = proc.threads()
+        except psutil.Error:
+            return
+        times = self.thread_times.setdefault(proc.pid, {})
+        for t in threads:
+            times[t.id] = {"user_time": t.user_time, "system_time": t.system_time}
 
     def run(self) -> None:
+        # processes already running (like the local bench server) are not
+        # part of the measured program
+        self._ignored = {
+            p.pid for p in self._proc.children(recursive=True)
+        }
+        start = time.thread_time()
         self._pst.cpu_percent(interval=None)
         self._proc.cpu_percent(interval=None)
+        if self._profiler is not None:
+            self._profiler.ignore_current_thread()
         while self._keep_checking:
-            time.sleep(self._interval)
+            self._wait_interval()
+            self._refresh_children()
             self.sys_wide_usage.append(self._pst.cpu_percent())
-            self.proc_usage.append(self._proc.cpu_percent())
+
+            usage = self._proc.cpu_percent()
+            record_threads = len(self.proc_usage) % self._thread_times_every == 0
+            if record_threads:
+                self._record_threads(self._proc)
+            for pid, child in list(self._children.items()):
+                try:
+                    child_usage = child.cpu_percent()
+                except psutil.Error:
+                    del self._children[pid]
+                    continue
+                self.children_usage[pid]["usage"].append(child_usage)
+                if record_threads:
+                    self._record_threads(child)
+                usage += child_usage
+            self.proc_usage.append(usage)
+        self._record_threads(self._proc)
+        for child in self._children.values():
+            self._record_threads(child)
+        # CPU time this sampling thread took from the measured process
+        self.cpu_seconds = time.thread_time() - start
+
+    def _wait_interval(self):
+        if self._profiler is None:
+            time.sleep(self._interval)
+            return
+        deadline = time.perf_counter() + self._interval
+        while self._keep_checking:
+            self._profiler.sample()
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return
+            time.sleep(min(self._profiler.interval, left))
 
     def stop_checking(self):
         self._keep_checking = False
@@ -56,8 +149,8 @@ class CpuSupervisor(Thread):
                 proc_max_usage=max(self.proc_usage),
                 proc_min_usage=min(self.proc_usage),
                 proc_usage=self.proc_usage,
+                children_usage=self.children_usage,
+                thread_times=self.thread_times,
                 recording_interval=self._interval,
         )
         return cpu_usage
-
-
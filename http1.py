@@ -0,0 +1,281 @@
+import socket
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+# parsing stops on a head longer than this, the bench server sends ~150 bytes
+MAX_HEAD_SIZE = 64 * 1024
+_HEAD_WINDOW = 1024
+
+
+class ParseError(Exception):
+    pass
+
+
+def split_url(url: str):
+    """(host, port, target) of an http url."""
+    split = urlsplit(url)
+    if split.scheme != "http":
+        raise ValueError(f"Only http urls are supported, got {url}")
+    target = split.path or "/"
+    if split.query:
+        target += "?" + split.query
+    return split.hostname, split.port or 80, target
+
+
+def build_request(host: str, port: int, target: str):
+    """A keep-alive GET, the headers kept to what requests sends."""
+    return (
+        f"GET {target} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "User-Agent: bench-http1\r\n"
+        "Accept: */*\r\n"
+        "Connection: keep-alive\r\n"
+        "\r\n"
+    ).encode("latin-1")
+
+
+class ResponseParser:
+    """
+    Incremental HTTP/1.1 response parser: feed it bytes as they are
+    received, in pieces of any size, possibly spanning several responses.
+
+    on_head(status, headers) is called once the head of a response is
+    complete, on_body(chunk) for every piece of its body (a memoryview of
+    the fed data, only valid during the call) and on_done(keep_alive) when
+    it ends. Header names are lowercased, bodies are sized by
+    Content-Length or chunked, responses to HEAD are not supported.
+    """
+
+    def __init__(self, on_head, on_body, on_done) -> None:
+        self._on_head = on_head
+        self._on_body = on_body
+        self._on_done = on_done
+        self._head = bytearray()
+        # "head", "body" (remaining bytes known), "size" (chunk size line),
+        # "chunk", "chunk_end" (crlf after a chunk) or "trailer"
+        self._state = "head"
+        self._remaining = 0
+        self._line = bytearray()
+        self._keep_alive = True
+
+    def feed(self, data):
+        data = memoryview(data)
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._state == "head":
+                pos = self._feed_head(data, pos)
+            elif self._state in ("body", "chunk"):
+                n = min(self._remaining, end - pos)
+                self._on_body(data[pos:pos + n])
+                pos += n
+                self._remaining -= n
+                if not self._remaining:
+                    if self._state == "body":
+                        self._done()
+                    else:
+                        self._state = "chunk_end"
+            else:
+                pos = self._feed_line(data, pos)
+
+    def _feed_head(self, data: memoryview, pos: int):
+        # the separator can be split between two feeds, search from just
+        # before the bytes already held. Only a window is copied, not the
+        # body that usually follows in the same feed
+        start = max(len(self._head) - 3, 0)
+        window = data[pos:pos + _HEAD_WINDOW]
+        self._head += window
+        index = self._head.find(b"\r\n\r\n", start)
+        if index < 0:
+            if len(self._head) > MAX_HEAD_SIZE:
+                raise ParseError("Response head too long")
+            return pos + len(window)
+        consumed = pos + len(window) - (len(self._head) - index - 4)
+        head = bytes(self._head[:index])
+        self._head.clear()
+        self._start_response(head)
+        return consumed
+
+    def _start_response(self, head: bytes):
+        status_line, *lines = head.decode("latin-1").split("\r\n")
+        version, _, rest = status_line.partition(" ")
+        try:
+            status = int(rest[:3])
+        except ValueError:
+            raise ParseError(f"Bad status line: {status_line!r}") from None
+        headers = {}
+        for line in lines:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        self._keep_alive = (
+            connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        )
+        self._on_head(status, headers)
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            self._state = "size"
+        elif "content-length" in headers:
+            self._remaining = int(headers["content-length"])
+            self._state = "body"
+            if not self._remaining:
+                self._done()
+        else:
+            raise ParseError("Responses delimited by closing the connection are not supported")
+
+    def _feed_line(self, data: memoryview, pos: int):
+        # the chunked framing lines are short, they go through _line
+        index = bytes(data[pos:pos + 256]).find(b"\n")
+        if index < 0:
+            self._line += data[pos:pos + 256]
+            if len(self._line) > MAX_HEAD_SIZE:
+                raise ParseError("Chunk framing line too long")
+            return min(pos + 256, len(data))
+        self._line += data[pos:pos + index + 1]
+        line = bytes(self._line).rstrip(b"\r\n")
+        self._line.clear()
+
+        if self._state == "size":
+            try:
+                self._remaining = int(line.split(b";", 1)[0], 16)
+            except ValueError:
+                raise ParseError(f"Bad chunk size line: {line!r}") from None
+            self._state = "chunk" if self._remaining else "trailer"
+        elif self._state == "chunk_end":
+            self._state = "size"
+        elif not line:
+            # the empty line after the (usually absent) trailer headers
+            self._done()
+        return pos + index + 1
+
+    def _done(self):
+        self._state = "head"
+        self._on_done(self._keep_alive)
+
+
+@dataclass(frozen=True)
+class PipelineUsage:
+    depth: int
+    connection_count: int
+    batch_count: int
+    request_count: int
+    received_count: int
+    meaning: dict = field(default_factory=lambda: {
+        "depth": "Requests written back to back before reading their responses",
+        "connection_count": "Connections opened, over every client",
+        "batch_count": "Batches of depth requests sent",
+        "received_count": "Responses received, the others were lost with their connection",
+    })
+
+
+def get_pipeline_usage(depth: int, connections: list["PipelinedConnection"]):
+    return PipelineUsage(
+        depth=depth,
+        connection_count=sum(c.connection_count for c in connections),
+        batch_count=sum(c.batch_count for c in connections),
+        request_count=sum(c.request_count for c in connections),
+        received_count=sum(c.received_count for c in connections),
+    )
+
+
+class PipelinedConnection:
+    """
+    Blocking keep-alive connection over a raw socket that sends requests in
+    batches: every request of a batch is written back to back, then the
+    responses are read in order into one receive buffer. The connection is
+    reopened for the next batch when the server closes it.
+    """
+
+    def __init__(self, host: str, port: int, buffer_size=64 * 1024) -> None:
+        self.host = host
+        self.port = port
+        self._buffer = memoryview(bytearray(buffer_size))
+        self._sock: socket.socket|None = None
+        self._parser: ResponseParser|None = None
+        self._handlers = None
+        self._received = 0
+        self._keep_alive = True
+        self.connection_count = 0
+        self.batch_count = 0
+        self.request_count = 0
+        self.received_count = 0
+        self.error: Exception|None = None
+
+    @classmethod
+    def for_url(cls, url: str, **kwargs):
+        host, port, _ = split_url(url)
+        return cls(host, port, **kwargs)
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port))
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # a fresh parser, a broken connection may leave one mid response
+        self._parser = ResponseParser(self._on_head, self._on_body, self._on_done)
+        self.connection_count += 1
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, targets: list[str], on_head, on_body, on_done):
+        """
+        GET every target in one batch. on_head(i, status), on_body(i, chunk)
+        and on_done(i) are called as response i arrives, chunk is only
+        valid during the call. Returns how many responses were received,
+        the ones after were lost with the connection (see error).
+        """
+        self._handlers = (on_head, on_body, on_done)
+        self.error = None
+        self.batch_count += 1
+        self.request_count += len(targets)
+        reused = self._sock is not None
+        received = self._fetch(targets)
+        if not received and reused:
+            # the server may have closed the idle connection meanwhile
+            received = self._fetch(targets)
+        self.received_count += received
+        return received
+
+    def _fetch(self, targets: list[str]):
+        self._received = 0
+        self._keep_alive = True
+        try:
+            if self._sock is None:
+                self._connect()
+            self._sock.sendall(b"".join(
+                build_request(self.host, self.port, target) for target in targets
+            ))
+            while self._received < len(targets) and self._keep_alive:
+                n = self._sock.recv_into(self._buffer)
+                if not n:
+                    raise ConnectionResetError("Connection closed before the last response")
+                self._parser.feed(self._buffer[:n])
+        except (OSError, ParseError) as e:
+            self.error = e
+            self.close()
+        if not self._keep_alive:
+            self.close()
+            if self._received < len(targets):
+                self.error = ConnectionResetError(
+                    f"Server closed the connection after {self._received} responses"
+                )
+        return self._received
+
+    def _on_head(self, status, headers):
+        self._handlers[0](self._received, status)
+
+    def _on_body(self, chunk):
+        self._handlers[1](self._received, chunk)
+
+    def _on_done(self, keep_alive):
+        self._handlers[2](self._received)
+        self._received += 1
+        self._keep_alive = keep_alive
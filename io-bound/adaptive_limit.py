@@ -0,0 +1,67 @@
+import os
+
+from lib import get_dir_name, raise_fd_limit
+from runner import RunOptions, program_runner
+from server import ServerConfig, bench_server
+
+from .asyncio import execute
+
+
+# latency jumps between 5ms and 200ms every 10s and every worker sheds the
+# requests above its capacity with a 503, so too little concurrency wastes
+# the fast phases and too much fails in the slow ones
+SERVER = ServerConfig(workers=2, delay="step:0.005,0.2,20", capacity=100)
+URL_COUNT = 20_000
+
+LIMITS = {
+    "fixed_50": {"window": 50},
+    "fixed_200": {"window": 200},
+    "fixed_1000": {"window": 1000},
+    "aimd": {"window": 1000, "limiter": "aimd"},
+    "gradient": {"window": 1000, "limiter": "gradient"},
+}
+
+
+def compare(url_count=URL_COUNT):
+    results = {}
+    for label, kwargs in LIMITS.items():
+        print("Execution with", label, "limit")
+        results[label], _ = program_runner(
+            execute,
+            f"asyncio_stream_{label}_limit_with_{url_count}_urls",
+            get_dir_name(__file__),
+            run_options=RunOptions(cooldown_seconds=5),
+            model="io-bound.asyncio_stream",
+            url_count=url_count,
+            mode="stream",
+            sink="null",
+            **kwargs,
+            descr=f"""Io bound execution using asyncio in stream mode with a {label.replace('_', ' ')} concurrency limit, against a server whose latency steps between 5ms and 200ms and which rejects what exceeds its capacity. The experiment fetches {url_count} urls and discards the response data. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+        )
+    return results
+
+
+if __name__ == "__main__":
+    if os.getenv("BENCH_SERVER_URL") is not None:
+        # bench_server would use it and ignore SERVER, the limits would be
+        # compared against a server that neither steps nor sheds load
+        raise SystemExit(
+            "This experiment needs the local server with a varying latency, unset BENCH_SERVER_URL"
+        )
+
+    raised = raise_fd_limit()
+    print("Raised fd limit", raised)
+
+    with bench_server(SERVER):
+        results = compare()
+
+    print(f"\n{'limit':<12}{'elapsed':>10}{'req/s':>9}{'failed':>8}{'p99':>10}{'avg limit':>11}")
+    for label, data in results.items():
+        _, failed = data["returned_value(s)"]
+        p99 = data["model_metrics"]["latency"]["total"]["p99_seconds"]
+        limiter = data["model_metrics"].get("limiter")
+        avg_limit = limiter["average_limit"] if limiter else LIMITS[label]["window"]
+        print(
+            f"{label:<12}{data['elapsed_seconds']:>9.2f}s{URL_COUNT / data['elapsed_seconds']:>9.0f}"
+            f"{failed:>8}{p99 * 1000:>8.1f}ms{avg_limit:>11.0f}"
+        )
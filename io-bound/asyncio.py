@@ -1,32 +1,46 @@
 import asyncio
-import os
 import time
-from pathlib import Path
-from tempfile import gettempdir
 
-from aiofile import async_open, FileIOWrapperBase
 import aiohttp
 
+from latency import LatencyRecorder
+from limiter import AdaptiveLimiter, run_limited
+from loop_monitor import monitor_loop
 from lib import (
     generate_valid_urls, 
     get_dir_name, 
     get_openable_fd_for_req,
     raise_fd_limit
 )
-from runner import program_runner
+from policy import RequestPolicy
+from runner import RunOptions, program_runner, report_metric
+from server import bench_server
+from sink import Sink, open_sink, write_response_chunks
 
 
 async def get_and_write_data(
     url:str,
     client: aiohttp.ClientSession, 
-    af:FileIOWrapperBase
+    sink:Sink,
+    latency:LatencyRecorder,
+    stream=False,
+    policy:RequestPolicy|None=None,
 ):
     try:
-        async with client.get(url) as response:
+        start = time.perf_counter()
+        response = await (
+            policy.aget(client, url) if policy is not None else client.get(url)
+        )
+        async with response:
+            ttfb = time.perf_counter() - start
             if not response.ok:
                 print(response.status)
                 return False
-            await af.write(await response.read())
+            if stream:
+                await write_response_chunks(response, sink.awrite)
+            else:
+                await sink.awrite(await response.read())
+            latency.record(ttfb, time.perf_counter() - start)
     except Exception as e:
         print(repr(e))
         return False
@@ -34,48 +48,119 @@ async def get_and_write_data(
         return True
 
 
-async def main(url_count=50):
-    tmp_filenam = Path(gettempdir()) / "data"
+async def stream_and_write_data(
+    urls,
+    client: aiohttp.ClientSession,
+    sink:Sink,
+    latency:LatencyRecorder,
+    window:int,
+    stream=False,
+    limiter:AdaptiveLimiter|None=None,
+    policy:RequestPolicy|None=None,
+):
+    ok_count = 0
+
+    async def worker():
+        nonlocal ok_count
+        # workers share the generator, urls are only built when pulled
+        for url in urls:
+            ok = await run_limited(
+                limiter, get_and_write_data, url, client, sink, latency, stream, policy
+            )
+            ok_count += ok
+
+    await asyncio.gather(*[worker() for _ in range(window)])
+    return ok_count
+
+
+async def main(
+    url_count=50,
+    mode="gather",
+    window=None,
+    stream=False,
+    sink="aiofile",
+    limiter=None,
+    retries=0,
+    hedge=False,
+):
     failed_count = 0
-    total_bytes = 0
+    latency = LatencyRecorder()
+    limit = get_openable_fd_for_req()
+    # with a limiter the window is only the cap, the limiter decides how
+    # much of it is used
+    adaptive = (
+        AdaptiveLimiter(limiter, max_limit=window or limit)
+        if limiter is not None else None
+    )
+    policy = RequestPolicy(retries, hedge)
     tcp_connector = aiohttp.TCPConnector(
-        limit=get_openable_fd_for_req(),
+        limit=limit,
         ttl_dns_cache=60*60*10
     )
 
-    async with async_open(tmp_filenam, "ab+") as af:
+    with monitor_loop():
+        async with open_sink(sink) as out:
         
-        async with aiohttp.ClientSession(connector=tcp_connector) as client:
-            results = await asyncio.gather(
-                *[
-                    get_and_write_data(url, client, af) 
-                    for url in generate_valid_urls(url_count)
-                ]
-            )
-            failed_count = url_count - sum(results)
-        
-        await af.flush()
-        total_bytes = os.stat(tmp_filenam).st_size
-    
-    os.unlink(tmp_filenam)
+            async with aiohttp.ClientSession(connector=tcp_connector) as client:
+                if mode == "stream":
+                    ok_count = await stream_and_write_data(
+                        generate_valid_urls(url_count),
+                        client,
+                        out,
+                        latency,
+                        window or limit,
+                        stream,
+                        adaptive,
+                        policy,
+                    )
+                    failed_count = url_count - ok_count
+                else:
+                    results = await asyncio.gather(
+                        *[
+                            run_limited(
+                                adaptive, get_and_write_data, url, client, out, latency, stream, policy
+                            )
+                            for url in generate_valid_urls(url_count)
+                        ]
+                    )
+                    failed_count = url_count - sum(results)
+
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    report_metric("policy", policy.get_usage())
+    if adaptive is not None:
+        report_metric("limiter", adaptive.get_usage())
+    return out.total_bytes, failed_count
 
-    return total_bytes, failed_count
+
+def execute(url_count=100_000, **kwargs):
+    return asyncio.run(main(url_count, **kwargs))
 
 
 if __name__ == "__main__":
     raised = raise_fd_limit()
     print("Raised fd limit", raised)
-
-    def execute(url_count=100_000):
-        return asyncio.run(main(url_count))
     
-    for count in [10_000, 100_000]:
-        print("Execution for:", count, "urls")
-        program_runner(
-            execute,
-            f"asyncio_data_with_{count}_urls",
-            get_dir_name(__file__),
-            url_count=count,
-            descr=f"""Io bound execution using asyncio programming. The experiment fetches {count} urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
-        )
-        time.sleep(10)
+    with bench_server():
+        for count in [10_000, 100_000]:
+            results = {}
+            for mode in ["gather", "stream"]:
+                print("Execution for:", count, "urls in", mode, "mode")
+                name = "asyncio_data" if mode == "gather" else "asyncio_stream_data"
+                results[mode], _ = program_runner(
+                    execute,
+                    f"{name}_with_{count}_urls",
+                    get_dir_name(__file__),
+                    run_options=RunOptions(cooldown_seconds=10),
+                    model="io-bound.asyncio" if mode == "gather" else "io-bound.asyncio_stream",
+                    url_count=count,
+                    mode=mode,
+                    descr=f"""Io bound execution using asyncio programming in {mode} mode (gather: one task per url, stream: a fixed pool of workers pulling urls lazily). The experiment fetches {count} urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+                )
+
+            for mode, data in results.items():
+                print(
+                    f"{mode}: {data['elapsed_seconds']:.2f}s,",
+                    f"{count / data['elapsed_seconds']:.0f} req/s,",
+                    f"max rss {data['memory']['max_usage'] / (1024 * 1024):.1f} MB"
+                )
@@ -0,0 +1,363 @@
+import asyncio
+import time
+from collections import deque
+
+from http1 import ParseError, ResponseParser, build_request, split_url
+from latency import LatencyRecorder
+from loop_monitor import monitor_loop
+from lib import (
+    generate_valid_urls,
+    get_dir_name,
+    get_openable_fd_for_req,
+    raise_fd_limit
+)
+from pools import PoolUsage
+from runner import RunOptions, program_runner, report_metric
+from server import bench_server
+from sink import CHUNK_SIZE, Sink, open_sink
+
+from .asyncio import execute as execute_aiohttp
+
+# streamed bodies waiting for the sink, reading pauses above the high mark
+_HIGH_WATER = 4 * CHUNK_SIZE
+_LOW_WATER = CHUNK_SIZE
+
+
+class Exchange:
+    """One request on a connection, filled by the protocol as bytes arrive."""
+
+    def __init__(self, loop:asyncio.AbstractEventLoop, transport, stream:bool) -> None:
+        self._loop = loop
+        self._transport = transport
+        self._stream = stream
+        self._waiter:asyncio.Future|None = None
+        self._chunks:deque[bytes] = deque()
+        self._buffered = 0
+        self._paused = False
+        self.status:int|None = None
+        self.body = bytearray()
+        self.finished = False
+        self.error:BaseException|None = None
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait(self):
+        self._waiter = self._loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def on_head(self, status:int):
+        self.status = status
+        self._wake()
+
+    def on_body(self, chunk:memoryview):
+        # chunk points into the receive buffer, the next read overwrites it
+        if not self._stream:
+            self.body += chunk
+            return
+        self._chunks.append(bytes(chunk))
+        self._buffered += len(chunk)
+        if self._buffered > _HIGH_WATER and not self._paused:
+            self._paused = True
+            self._transport.pause_reading()
+        self._wake()
+
+    def on_done(self):
+        self.finished = True
+        self._wake()
+
+    def on_error(self, error:BaseException):
+        self.error = error
+        self._wake()
+
+    async def read_head(self):
+        while self.status is None:
+            if self.error is not None:
+                raise self.error
+            await self._wait()
+        return self.status
+
+    async def read(self):
+        while not self.finished:
+            if self.error is not None:
+                raise self.error
+            await self._wait()
+        return self.body
+
+    async def iter_chunks(self):
+        while 1:
+            while self._chunks:
+                chunk = self._chunks.popleft()
+                self._buffered -= len(chunk)
+                if self._paused and self._buffered < _LOW_WATER:
+                    self._paused = False
+                    self._transport.resume_reading()
+                yield chunk
+            if self.finished:
+                return
+            if self.error is not None:
+                raise self.error
+            await self._wait()
+
+
+class HttpProtocol(asyncio.BufferedProtocol):
+    """
+    Keep-alive HTTP/1.1 client connection, one request at a time. The
+    socket is read straight into a receive buffer allocated once per
+    connection.
+    """
+
+    def __init__(self, buffer_size=CHUNK_SIZE) -> None:
+        self._buffer = memoryview(bytearray(buffer_size))
+        self._parser = ResponseParser(self._on_head, self._on_body, self._on_done)
+        self._exchange:Exchange|None = None
+        self.transport:asyncio.Transport|None = None
+        self.reusable = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.reusable = True
+
+    def get_buffer(self, sizehint):
+        return self._buffer
+
+    def buffer_updated(self, nbytes):
+        try:
+            self._parser.feed(self._buffer[:nbytes])
+        except ParseError as e:
+            self.reusable = False
+            if self._exchange is not None:
+                self._exchange.on_error(e)
+            self.transport.abort()
+
+    def connection_lost(self, exc):
+        self.reusable = False
+        if self._exchange is not None:
+            self._exchange.on_error(
+                exc or ConnectionResetError("Connection closed before the response ended")
+            )
+            self._exchange = None
+
+    def request(self, data:bytes, stream=False):
+        self._exchange = Exchange(asyncio.get_running_loop(), self.transport, stream)
+        self.transport.write(data)
+        return self._exchange
+
+    def _on_head(self, status, headers):
+        if self._exchange is not None:
+            self._exchange.on_head(status)
+
+    def _on_body(self, chunk):
+        if self._exchange is not None:
+            self._exchange.on_body(chunk)
+
+    def _on_done(self, keep_alive):
+        self.reusable = keep_alive
+        if self._exchange is not None:
+            self._exchange.on_done()
+            self._exchange = None
+
+    def close(self):
+        self.reusable = False
+        if self.transport is not None:
+            self.transport.close()
+
+
+class ConnectionPool:
+    """
+    Connections by (host, port), at most limit open at once. Idle ones are
+    reused last in first out so the warmest connection serves next.
+    """
+
+    def __init__(self, limit:int) -> None:
+        self.limit = limit
+        self._idle:dict[tuple[str, int], list[HttpProtocol]] = {}
+        self._open_count = 0
+        self._waiters:deque[asyncio.Future] = deque()
+        self.new_connection_count = 0
+        self.request_count = 0
+
+    async def acquire(self, host:str, port:int):
+        self.request_count += 1
+        loop = asyncio.get_running_loop()
+        while 1:
+            idle = self._idle.get((host, port))
+            while idle:
+                conn = idle.pop()
+                if conn.reusable:
+                    return conn
+                self._open_count -= 1
+
+            if self._open_count < self.limit:
+                break
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+
+        self._open_count += 1
+        try:
+            _, conn = await loop.create_connection(HttpProtocol, host, port)
+        except BaseException:
+            self._open_count -= 1
+            self._wake()
+            raise
+        self.new_connection_count += 1
+        return conn
+
+    def release(self, host:str, port:int, conn:HttpProtocol, reusable:bool):
+        if reusable and conn.reusable:
+            self._idle.setdefault((host, port), []).append(conn)
+        else:
+            conn.close()
+            self._open_count -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+    def get_usage(self):
+        reused_count = self.request_count - self.new_connection_count
+        return PoolUsage(
+            strategy="protocol",
+            session_count=1,
+            pool_maxsize=self.limit,
+            new_connection_count=self.new_connection_count,
+            request_count=self.request_count,
+            reused_connection_count=reused_count,
+            discarded_connection_count=0,
+            reuse_ratio=reused_count / self.request_count if self.request_count else 0.0,
+        )
+
+
+async def get_and_write_data(
+    url:str,
+    pool:ConnectionPool,
+    sink:Sink,
+    latency:LatencyRecorder,
+    stream=False,
+):
+    host, port, target = split_url(url)
+    conn = None
+    reusable = False
+    try:
+        start = time.perf_counter()
+        conn = await pool.acquire(host, port)
+        exchange = conn.request(build_request(host, port, target), stream)
+        status = await exchange.read_head()
+        ttfb = time.perf_counter() - start
+        ok = 200 <= status < 400
+        # the body is read even on failure so the connection can be reused
+        if stream:
+            async for chunk in exchange.iter_chunks():
+                if ok:
+                    await sink.awrite(chunk)
+        else:
+            body = await exchange.read()
+            if ok:
+                await sink.awrite(body)
+        reusable = True
+        if not ok:
+            print(status)
+            return False
+        latency.record(ttfb, time.perf_counter() - start)
+    except Exception as e:
+        print(repr(e))
+        return False
+    else:
+        return True
+    finally:
+        if conn is not None:
+            pool.release(host, port, conn, reusable)
+
+
+async def main(url_count=50, window=None, stream=False, sink="aiofile"):
+    limit = get_openable_fd_for_req()
+    window = window or limit
+    latency = LatencyRecorder()
+    pool = ConnectionPool(limit)
+    urls = generate_valid_urls(url_count)
+    ok_count = 0
+
+    async def worker():
+        nonlocal ok_count
+        for url in urls:
+            ok = await get_and_write_data(url, pool, out, latency, stream)
+            ok_count += ok
+
+    with monitor_loop():
+        async with open_sink(sink) as out:
+            try:
+                await asyncio.gather(*[worker() for _ in range(window)])
+            finally:
+                pool.close()
+
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    report_metric("pool", pool.get_usage())
+    return out.total_bytes, url_count - ok_count
+
+
+def execute(url_count=100_000, **kwargs):
+    return asyncio.run(main(url_count, **kwargs))
+
+
+def get_cpu_seconds(data:dict):
+    # average process usage over the run, in cores, times its length
+    return data["cpu"]["proc_average_usage"] / 100 * data["elapsed_seconds"]
+
+
+if __name__ == "__main__":
+    raised = raise_fd_limit()
+    print("Raised fd limit", raised)
+
+    with bench_server():
+        for count in [10_000, 100_000]:
+            results = {}
+            for label, fn, model in [
+                ("aiohttp", execute_aiohttp, "io-bound.asyncio_stream"),
+                ("protocol", execute, "io-bound.asyncio_protocol"),
+            ]:
+                print("Execution for:", count, "urls with", label)
+                kwargs = {"mode": "stream"} if label == "aiohttp" else {}
+                results[label], _ = program_runner(
+                    fn,
+                    f"asyncio_{label}_data_with_{count}_urls",
+                    get_dir_name(__file__),
+                    run_options=RunOptions(cooldown_seconds=10),
+                    model=model,
+                    url_count=count,
+                    **kwargs,
+                    descr=f"""Io bound execution using asyncio with {"aiohttp" if label == "aiohttp" else "a minimal asyncio.BufferedProtocol HTTP/1.1 client"}, a fixed pool of workers pulling urls lazily. The experiment fetches {count} urls and stores the response data into a file. The gap with the other client is the cost of the HTTP framework on top of the event loop. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+                )
+
+            for label, data in results.items():
+                cpu_seconds = get_cpu_seconds(data)
+                print(
+                    f"{label}: {data['elapsed_seconds']:.2f}s,",
+                    f"{count / data['elapsed_seconds']:.0f} req/s,",
+                    f"cpu {data['cpu']['proc_average_usage']:.1f}%,",
+                    f"{cpu_seconds / count * 1e6:.0f} cpu us/req"
+                )
+            aiohttp_cpu = get_cpu_seconds(results["aiohttp"])
+            protocol_cpu = get_cpu_seconds(results["protocol"])
+            if aiohttp_cpu:
+                print(f"aiohttp overhead: {(aiohttp_cpu - protocol_cpu) / aiohttp_cpu:.0%} of its CPU time")
@@ -0,0 +1,211 @@
+import asyncio
+import multiprocessing
+import os
+from multiprocessing.connection import Connection
+
+import aiohttp
+
+from corpus import UrlCorpus, ensure_corpus, open_corpus
+from latency import LatencyRecorder
+from lib import (
+    get_dir_name,
+    get_openable_fd_for_req,
+    raise_fd_limit,
+    shard
+)
+from loop_monitor import add_usages, disable, monitor_loop
+from policy import RequestPolicy
+from results import ResultStore
+from runner import RunOptions, get_baseline_params, program_runner, report_metric
+from server import bench_server
+from sink import open_sink
+
+from .asyncio import stream_and_write_data
+
+
+async def async_main(
+    corpus_path:str,
+    start:int,
+    stop:int,
+    concurrent_limit:int,
+    stream=False,
+    sink="file",
+    retries=0,
+    hedge=False,
+):
+    latency = LatencyRecorder()
+    # per process, the workers share no state
+    policy = RequestPolicy(retries, hedge)
+    tcp_connector = aiohttp.TCPConnector(
+        limit=concurrent_limit,
+        ttl_dns_cache=60*60*10
+    )
+    # every worker maps the same corpus file instead of rebuilding urls
+    with UrlCorpus(corpus_path) as corpus, monitor_loop():
+        async with open_sink(sink) as out:
+            async with aiohttp.ClientSession(connector=tcp_connector) as client:
+                ok_count = await stream_and_write_data(
+                    corpus.urls(start, stop),
+                    client,
+                    out,
+                    latency,
+                    concurrent_limit,
+                    stream,
+                    policy=policy,
+                )
+    return (
+        out.total_bytes,
+        (stop - start) - ok_count,
+        out.get_usage(),
+        latency.merged(),
+        policy.get_usage(),
+    )
+
+
+def run_worker(
+    corpus_path:str,
+    start:int,
+    stop:int,
+    concurrent_limit:int,
+    stream:bool,
+    sink:str,
+    retries:int,
+    hedge:bool,
+    conn:Connection
+):
+    total_bytes, failed_count, sink_usage, latency, policy = asyncio.run(
+        async_main(
+            corpus_path, start, stop, concurrent_limit, stream, sink, retries, hedge
+        )
+    )
+    conn.send({
+        "pid": os.getpid(),
+        "total_bytes": total_bytes,
+        "failed_count": failed_count,
+        "sink": sink_usage,
+        "latency": latency,
+        "policy": policy,
+        # the loop monitoring enabled in the parent, if any, carried over
+        # by fork, sent back for the run result
+        "loops": disable(),
+    })
+    conn.close()
+
+
+
+def prepare(url_count, **params):
+    # run by program_runner before the measured runs
+    ensure_corpus(url_count)
+
+
+def main(
+    process_count=4,
+    url_count=10_000,
+    stream=False,
+    sink="file",
+    retries=0,
+    hedge=False,
+):
+    # fd openable in the process, each worker gets its own limit
+    openable_by_p = get_openable_fd_for_req()
+    if process_count > openable_by_p:
+        raise ValueError(
+            "Process count should be less than fd limit",
+        )
+
+    # built once here, the workers only map it
+    with open_corpus(url_count) as corpus:
+        corpus_path = corpus.path
+
+    ctx = multiprocessing.get_context("fork")
+    workers = []
+    for k in range(process_count):
+        start, stop = shard(k, process_count, url_count)
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        p = ctx.Process(
+            target=run_worker,
+            args=(
+                corpus_path,
+                start,
+                stop,
+                openable_by_p // process_count,
+                stream,
+                sink,
+                retries,
+                hedge,
+                child_conn,
+            )
+        )
+        p.start()
+        child_conn.close()
+        workers.append((p, parent_conn))
+
+    total_bytes = 0
+    failed_count = 0
+    per_process = []
+    latency = LatencyRecorder()
+    for p, conn in workers:
+        result = conn.recv()
+        p.join()
+        total_bytes += result["total_bytes"]
+        failed_count += result["failed_count"]
+        latency.add(*result.pop("latency"))
+        add_usages(result.pop("loops"))
+        per_process.append(result)
+
+    report_metric("processes", per_process)
+    report_metric("latency", latency.get_usage())
+    return total_bytes, failed_count
+
+
+# the sink of the single loop model runs compared with, both sides write
+# the same way so only the concurrency model differs
+COMPARED_SINK = "aiofile"
+
+
+def get_single_loop_elapsed(url_count: int, sink=COMPARED_SINK):
+    with ResultStore() as store:
+        run = store.get_latest(
+            model="io-bound.asyncio_stream",
+            params=get_baseline_params(
+                url_count=url_count,
+                sink=sink,
+                stream=False,
+                window=None,
+                limiter=None,
+                retries=0,
+                hedge=False,
+            ),
+        )
+    return run.elapsed_seconds if run is not None else None
+
+
+if __name__ == "__main__":
+    raised = raise_fd_limit()
+    print("Raised fd limit", raised)
+    dir_name = get_dir_name(__file__)
+
+    with bench_server():
+        for count in [10_000, 100_000]:
+            single_loop_elapsed = get_single_loop_elapsed(count)
+            if single_loop_elapsed is None:
+                print("No asyncio stream result found for", count, "urls, run io-bound.asyncio first to compare")
+
+            for process_count in sorted({2, 4, os.cpu_count() or 1}):
+                print("execution for", process_count, "processes with", count, "urls...\n")
+                data, _ = program_runner(
+                    main,
+                    f"{process_count}_processes_plus_asyncio_with_{count}_urls",
+                    dir_name,
+                    run_options=RunOptions(cooldown_seconds=10),
+                    process_count=process_count,
+                    url_count=count,
+                    sink=COMPARED_SINK,
+                    descr=f"""Io bound execution using {process_count} processes each running its own asyncio loop over a shard of the urls. The experiment fetches {count} urls and stores the response data into a file through the {COMPARED_SINK} sink, like the single loop model. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+                )
+                req_per_s = count / data["elapsed_seconds"]
+                print(f"{process_count} processes: {req_per_s:.0f} req/s")
+                if single_loop_elapsed is not None:
+                    single_req_per_s = count / single_loop_elapsed
+                    verdict = "overtakes" if req_per_s > single_req_per_s else "is behind"
+                    print(f"{verdict} the single loop model ({single_req_per_s:.0f} req/s)")
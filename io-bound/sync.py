@@ -1,49 +1,156 @@
-import os
+import itertools
 import requests
-import tempfile
 import time
 
+from http1 import PipelinedConnection, get_pipeline_usage, split_url
+from latency import LatencyRecorder
 from lib import generate_valid_urls, get_dir_name
-from runner import program_runner
+from policy import RequestPolicy
+from runner import RunOptions, program_runner, report_metric
+from server import bench_server
+from sink import Sink, new_buffer, open_sink, write_response_into
 
 
-def main(url_count=50):
+def get_and_write_pipelined(
+    conn:PipelinedConnection,
+    urls:list[str],
+    sink:Sink,
+    latency:LatencyRecorder,
+    stream=False,
+):
+    """Fetch urls in one pipelined batch on conn, returns the failed count."""
     failed_count = 0
-    total_bytes = 0
+    statuses = [0] * len(urls)
+    ttfbs = [0.0] * len(urls)
+    body = bytearray()
 
-    with tempfile.NamedTemporaryFile(mode="ab+", delete=True) as f:
+    def on_head(i, status):
+        statuses[i] = status
+        # every response of the batch waits for the ones before it, its
+        # latency counts from the batch being sent
+        ttfbs[i] = time.perf_counter() - start
+        body.clear()
+
+    def on_body(i, chunk):
+        if statuses[i] >= 400:
+            return
+        if stream:
+            sink.write(bytes(chunk))
+        else:
+            body.extend(chunk)
+
+    def on_done(i):
+        nonlocal failed_count
+        if statuses[i] >= 400:
+            print(statuses[i])
+            failed_count += 1
+            return
+        if not stream:
+            sink.write(bytes(body))
+        latency.record(ttfbs[i], time.perf_counter() - start)
+
+    start = time.perf_counter()
+    received = conn.fetch(
+        [split_url(url)[2] for url in urls], on_head, on_body, on_done
+    )
+    if received < len(urls):
+        print(conn.error)
+        failed_count += len(urls) - received
+    return failed_count
+
+
+def main_pipelined(url_count=50, pipeline=8, stream=False, sink="file"):
+    failed_count = 0
+    latency = LatencyRecorder()
+    urls = generate_valid_urls(url_count)
+    conn = None
+
+    with open_sink(sink) as out:
+        while batch := list(itertools.islice(urls, pipeline)):
+            if conn is None:
+                conn = PipelinedConnection.for_url(batch[0])
+            failed_count += get_and_write_pipelined(conn, batch, out, latency, stream)
+        if conn is not None:
+            conn.close()
+
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    report_metric("pipeline", get_pipeline_usage(pipeline, [conn] if conn else []))
+    return out.total_bytes, failed_count
+
+
+def main(
+    url_count=50,
+    stream=False,
+    sink="file",
+    retries=0,
+    hedge=False,
+    pipeline=0,
+):
+    if pipeline:
+        if retries or hedge:
+            raise ValueError("retries and hedge need the requests client, they do not apply to pipeline")
+        return main_pipelined(url_count, pipeline, stream, sink)
+
+    failed_count = 0
+    buffer = new_buffer() if stream else None
+    latency = LatencyRecorder()
+    policy = RequestPolicy(retries, hedge)
+
+    with open_sink(sink) as out, policy:
         
         with requests.Session() as s:
             for url in generate_valid_urls(url_count):
                 try:
-                    response = s.get(url=url)
+                    start = time.perf_counter()
+                    with policy.get(s, url, stream=stream) as response:
+                        if not response.ok:
+                            print(response.status_code)
+                            failed_count += 1
+                            continue
+                        if stream:
+                            write_response_into(response, out.write, buffer)
+                        else:
+                            out.write(response.content)
+                        latency.record(
+                            response.elapsed.total_seconds(),
+                            time.perf_counter() - start
+                        )
                 except Exception as e:
                     print(e)
                     failed_count += 1
                     continue
-                else:
-                    if not response.ok:
-                        print(response.status_code)
-                        failed_count += 1
-                        continue
-                    f.write(response.content)
-        
-        f.flush()
-        total_bytes = os.stat(f.name).st_size
 
-    return total_bytes, failed_count
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    report_metric("policy", policy.get_usage())
+    return out.total_bytes, failed_count
 
 
 if __name__ == "__main__":
-    for count in [100, 1000]:
-        print("Execution for", count,"urls...")
-        program_runner(
-            main,
-            f"sync_data_with_{count}_urls",
-            get_dir_name(__file__),
-            url_count=count,
-            descr=f"""Io bound execution using sync programming. The experiment fetches {count} urls and stores the response data into a file. The returned values represent the total bytes received from network and the number of failed requests (>=400 status code or error)."""
-        )
-        time.sleep(5)
-        
+    with bench_server():
+        for count in [100, 1000]:
+            print("Execution for", count,"urls...")
+            program_runner(
+                main,
+                f"sync_data_with_{count}_urls",
+                get_dir_name(__file__),
+                run_options=RunOptions(cooldown_seconds=5),
+                url_count=count,
+                descr=f"""Io bound execution using sync programming. The experiment fetches {count} urls and stores the response data into a file. The returned values represent the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+            )
 
+        # raw keep-alive sockets, 1 is one round trip per request without
+        # requests, above that the requests of a batch share round trips
+        for depth in [1, 16, 64]:
+            print("Pipelined execution for 10000 urls,", depth, "requests per batch...")
+            program_runner(
+                main,
+                f"sync_pipeline_{depth}_data_with_10000_urls",
+                get_dir_name(__file__),
+                run_options=RunOptions(cooldown_seconds=5),
+                url_count=10_000,
+                pipeline=depth,
+                descr=f"""Io bound execution using sync programming over a raw socket with HTTP/1.1 pipelining, {depth} requests are written back to back then their responses read in order. The experiment fetches 10000 urls and stores the response data into a file. The returned values represent the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+            )
+        
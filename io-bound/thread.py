@@ -1,113 +1,196 @@
-import os
-import tempfile
-from threading import Thread, Lock
+from threading import Thread
+import itertools
 import time
-from typing import BinaryIO
-from queue import Queue, Empty
 
 import requests
 
+from contention import make_lock
+from corpus import UrlCorpus, ensure_corpus, open_corpus
+from http1 import PipelinedConnection, get_pipeline_usage
+from latency import LatencyRecorder
 from lib import (
-    generate_valid_urls, 
     get_dir_name, 
     raise_fd_limit, 
     get_openable_fd_for_req
 )
-from runner import program_runner
+from policy import RequestPolicy
+from pools import SessionPools
+from runner import RunOptions, program_runner, report_metric
+from server import bench_server
+from sink import Sink, new_buffer, open_sink, write_response_into
+
+from .sync import get_and_write_pipelined
 
 
 def get_and_write_data(
-    q:Queue,
+    corpus:UrlCorpus,
+    next_index,
     client:requests.Session, 
-    f:BinaryIO,
-    f_lock: Lock,
-    failed_count
+    sink:Sink,
+    failed_count,
+    latency:LatencyRecorder,
+    policy:RequestPolicy,
+    stream=False
 ):
-    while 1:
+    # only the streamed reads need it, every thread would otherwise hold
+    # 64 KiB for nothing
+    buffer = new_buffer() if stream else None
+
+    # next() on the shared itertools.count is atomic under the GIL, so
+    # every index goes to exactly one thread
+    while (i := next(next_index)) < len(corpus):
+        url = corpus.url(i)
         try:
-            url = q.get(block=False)
-            try:
-                response = client.get(url)
-            except Exception as e:
-                print(e)
-                failed_count.increment()
-            else:
+            start = time.perf_counter()
+            with policy.get(client, url, stream=stream) as response:
                 if not response.ok:
                     print(response.status_code)
                     failed_count.increment()
+                    continue
+                if stream:
+                    write_response_into(response, sink.write, buffer)
                 else:
-                    with f_lock:
-                        f.write(response.content)
-            finally:
-                q.task_done()
-        except Empty:
-            break
-
-def main(thread_count=5):
+                    sink.write(response.content)
+                latency.record(
+                    response.elapsed.total_seconds(),
+                    time.perf_counter() - start
+                )
+        except Exception as e:
+            print(e)
+            failed_count.increment()
+
+def get_and_write_pipelined_data(
+    corpus:UrlCorpus,
+    next_index,
+    conn:PipelinedConnection,
+    sink:Sink,
+    failed_count,
+    latency:LatencyRecorder,
+    pipeline:int,
+    stream=False
+):
+    with conn:
+        while 1:
+            batch = []
+            while len(batch) < pipeline and (i := next(next_index)) < len(corpus):
+                batch.append(corpus.url(i))
+            if not batch:
+                return
+            failed = get_and_write_pipelined(conn, batch, sink, latency, stream)
+            for _ in range(failed):
+                failed_count.increment()
+
+
+def prepare(url_count, **params):
+    # run by program_runner before the measured runs
+    ensure_corpus(url_count)
+
+
+def main(
+    thread_count=5,
+    stream=False,
+    sink="file",
+    url_count=10_000,
+    retries=0,
+    hedge=False,
+    pool="default",
+    pipeline=0,
+):
     if thread_count > get_openable_fd_for_req():
         ValueError(
             "Thread count should be less than process fd limit",
         )
+    if pipeline and (retries or hedge):
+        raise ValueError("retries and hedge need the requests client, they do not apply to pipeline")
 
-    total_bytes = 0
-    total_urls = 10000
     threads:list[Thread] = []
-    f_lock = Lock()
-    url_q = Queue()
-
-    for url in generate_valid_urls(total_urls):
-        url_q.put(url)
+    corpus = open_corpus(url_count)
+    next_index = itertools.count()
 
     class FailedCounter:
         def __init__(self) -> None:
             self.count = 0
-            self.c_lock = Lock()
+            self.c_lock = make_lock("failed_count")
 
         def increment(self):
             with self.c_lock:
                 self.count += 1
     
     failed_count = FailedCounter()
-
-    with tempfile.NamedTemporaryFile("ab+", delete=True) as f:
-        
-        with requests.Session() as client:
-            for _ in range(thread_count):
+    latency = LatencyRecorder()
+    # every thread may wait on a hedged pair at once
+    policy = RequestPolicy(retries, hedge, hedge_workers=2 * thread_count)
+
+    with (
+        open_sink(sink) as out,
+        policy,
+        SessionPools(pool, thread_count) as pools,
+    ):
+        # with pipeline every thread owns a raw connection instead
+        conns = [
+            PipelinedConnection.for_url(corpus.url(0))
+            for _ in range(thread_count)
+        ] if pipeline and len(corpus) else []
+        for k in range(thread_count):
+            if conns:
+                t = Thread(
+                        target=get_and_write_pipelined_data,
+                        args=(
+                            corpus,
+                            next_index,
+                            conns[k],
+                            out,
+                            failed_count,
+                            latency,
+                            pipeline,
+                            stream
+                        )
+                )
+            else:
                 t = Thread(
                         target=get_and_write_data, 
                         args=(
-                            url_q, 
-                            client,
-                            f,
-                            f_lock,
-                            failed_count
+                            corpus,
+                            next_index,
+                            pools.session(k),
+                            out,
+                            failed_count,
+                            latency,
+                            policy,
+                            stream
                         )
                 )
-                t.start()
-                threads.append(t)
-        
+            t.start()
+            threads.append(t)
+
         for thread in threads:
             thread.join()
+        # the counters go with the pools on close
+        pool_usage = pools.get_usage()
+    corpus.close()
 
-        f.flush()
-        total_bytes = os.stat(f.name).st_size
-
-    return total_bytes, failed_count.count
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    if pipeline:
+        report_metric("pipeline", get_pipeline_usage(pipeline, conns))
+    else:
+        report_metric("policy", policy.get_usage())
+        report_metric("pool", pool_usage)
+    return out.total_bytes, failed_count.count
 
 
 if __name__ == "__main__":
     raised = raise_fd_limit()
     print("Raised fd limit", raised)
     
-    for count in [10, 100, get_openable_fd_for_req()]:
-        print("execution for", count, "threads...\n")
-        program_runner(
-            main,
-            f"{count}_threads_data_with_10_000_urls",
-            get_dir_name(__file__),
-            thread_count=count,
-            descr=f"""Io bound execution using {count} threads. The experiment fetches 10_000 urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
-        )
-        time.sleep(10)
-
-
+    with bench_server():
+        for count in [10, 100, get_openable_fd_for_req()]:
+            print("execution for", count, "threads...\n")
+            program_runner(
+                main,
+                f"{count}_threads_data_with_10_000_urls",
+                get_dir_name(__file__),
+                run_options=RunOptions(cooldown_seconds=10),
+                thread_count=count,
+                descr=f"""Io bound execution using {count} threads. The experiment fetches 10_000 urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+            )
@@ -1,21 +1,27 @@
 import asyncio
-import tempfile
-import os
 import io
 import time
-from threading import Thread, Lock
+from collections.abc import Iterable
+from threading import Thread
 from queue import Empty, Queue
-from typing import BinaryIO
 
 import aiohttp
 
+from contention import make_lock
+from corpus import UrlCorpus, ensure_corpus, open_corpus
+from latency import LatencyRecorder
+from limiter import AdaptiveLimiter, run_limited
+from loop_monitor import monitor_loop
 from lib import (
-    generate_valid_urls, 
     get_dir_name, 
     get_openable_fd_for_req,
-    raise_fd_limit
+    raise_fd_limit,
+    shard
 )
-from runner import program_runner
+from policy import RequestPolicy
+from runner import RunOptions, program_runner, report_metric
+from server import bench_server
+from sink import Sink, open_sink, write_response_chunks
 
 
 async def target_task(
@@ -23,14 +29,26 @@ async def target_task(
     client:aiohttp.ClientSession,
     vf:io.BytesIO,
     vf_lock:asyncio.Lock,
+    latency:LatencyRecorder,
+    write_chunk=None,
+    policy:RequestPolicy|None=None,
 ):
     try:
-        async with client.get(url) as response:
+        start = time.perf_counter()
+        response = await (
+            policy.aget(client, url) if policy is not None else client.get(url)
+        )
+        async with response:
+            ttfb = time.perf_counter() - start
             if not response.ok:
                 print(response.status)
                 return False
-            async with vf_lock: 
-                vf.write(await response.read())
+            if write_chunk is not None:
+                await write_response_chunks(response, write_chunk)
+            else:
+                async with vf_lock: 
+                    vf.write(await response.read())
+            latency.record(ttfb, time.perf_counter() - start)
             return True
     except Exception as e:
         print(e)
@@ -38,61 +56,99 @@ async def target_task(
 
 
 async def async_main(
-        urls:list, 
-        concurrent_limit:int
+        urls:Iterable[str], 
+        concurrent_limit:int,
+        latency:LatencyRecorder,
+        sink:Sink|None=None,
+        limiter:AdaptiveLimiter|None=None,
+        policy:RequestPolicy|None=None,
 ):
     vf = io.BytesIO()
     vf_lock = asyncio.Lock()
     failed_count = 0
+    # chunks go straight to the sink instead of the batch buffer
+    write_chunk = sink.awrite if sink is not None else None
     tcp_connector = aiohttp.TCPConnector(
         limit=concurrent_limit,
         ttl_dns_cache=60*60*10,
     )
+
     async with aiohttp.ClientSession(connector=tcp_connector) as client:
         results = await asyncio.gather(
             *[
-                target_task(
+                run_limited(
+                    limiter,
+                    target_task,
                     url,
                     client,
                     vf, 
                     vf_lock,
+                    latency,
+                    write_chunk,
+                    policy,
                 ) for url in urls
             ]
         )
-        failed_count = len(urls) - sum(results)
-    return vf.getvalue(), failed_count
+        failed_count = len(results) - sum(results)
+    return vf.getbuffer(), failed_count
 
 
 def get_and_write_data(
     q:Queue,
-    f:BinaryIO,
-    f_lock:Lock,
+    corpus:UrlCorpus,
+    sink:Sink,
     concurrent_limit:int,
     failed_counter,
+    latency:LatencyRecorder,
+    stream=False,
+    limiter:AdaptiveLimiter|None=None,
+    policy:RequestPolicy|None=None,
 ):
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
-        while 1:
-            try:
-                urls = q.get(block=False)
-            except Empty:
-                break
-            else:
+        # one monitor per thread loop, kept over every url range it runs
+        with monitor_loop(loop):
+            while 1:
                 try:
-                    data, failed_count = loop.run_until_complete(
-                        async_main(urls, concurrent_limit)
-                    )
-                    failed_counter.increment(failed_count)
-                    with f_lock:
-                        f.write(data)
-                finally:
-                    q.task_done()
+                    start, stop = q.get(block=False)
+                except Empty:
+                    break
+                else:
+                    try:
+                        data, failed_count = loop.run_until_complete(
+                            async_main(
+                                corpus.urls(start, stop),
+                                concurrent_limit,
+                                latency,
+                                sink if stream else None,
+                                limiter,
+                                policy,
+                            )
+                        )
+                        failed_counter.increment(failed_count)
+                        if not stream:
+                            sink.write(data)
+                    finally:
+                        q.task_done()
     finally:
         loop.close()
 
 
-def main(thread_count=5):
+def prepare(url_count, **params):
+    # run by program_runner before the measured runs
+    ensure_corpus(url_count)
+
+
+def main(
+    thread_count=5,
+    stream=False,
+    sink="file",
+    url_count=10_000,
+    limiter=None,
+    retries=0,
+    hedge=False,
+):
     # fd openable in the process
     openable_by_t = get_openable_fd_for_req()
     if thread_count > openable_by_t:
@@ -102,45 +158,51 @@ def main(thread_count=5):
 
     threads:list[Thread] = []
     q = Queue()
-    url_count = 10_000
-    total_bytes = 0
-    f_lock = Lock()
     
-    # create a set of of url for each thread to process
-    url_set_count = url_count // thread_count
-    url_set = []
-    for url in generate_valid_urls(url_count):
-        if len(url_set) >= url_set_count:
-            q.put(url_set)
-            url_set = []
-        url_set.append(url)
-
-    # if we did not reach url_set_count but url_set contains url
-    if url_set:
-        q.put(url_set)
+    corpus = open_corpus(url_count)
+    
+    # an index range of the corpus for each thread to process, the urls
+    # are only read when a thread picks its range
+    for k in range(thread_count):
+        q.put(shard(k, thread_count, url_count))
 
     class FailedCounter:
         def __init__(self) -> None:
             self.count = 0
-            self.c_lock = Lock()
+            self.c_lock = make_lock("failed_count")
 
         def increment(self, count=1):
             with self.c_lock:
                 self.count += count
     
     failed_counter = FailedCounter()
+    latency = LatencyRecorder()
+    # one limiter for every thread, it bounds the requests in flight across
+    # all the loops while each connector keeps its even share as a cap
+    adaptive = (
+        AdaptiveLimiter(
+            limiter, max_limit=openable_by_t // thread_count * thread_count
+        )
+        if limiter is not None else None
+    )
+    # shared by the threads so retry budget and hedge delay see all traffic
+    policy = RequestPolicy(retries, hedge)
 
-    with tempfile.NamedTemporaryFile("ab+", delete=True) as f:
+    with open_sink(sink) as out:
         for _ in range(thread_count):
             t = Thread(
                 target=get_and_write_data,
                 args=(
                     q, 
-                    f, 
-                    f_lock,
+                    corpus,
+                    out, 
                     # less fd opened better than more, no exact number needed 
                     openable_by_t // thread_count,
                     failed_counter,
+                    latency,
+                    stream,
+                    adaptive,
+                    policy,
                 )
             )
             t.start()
@@ -148,26 +210,28 @@ def main(thread_count=5):
 
         for t in threads:
             t.join()
+    corpus.close()
 
-        f.flush()
-        total_bytes = os.stat(f.name).st_size
-    
-    return total_bytes, failed_counter.count
+    report_metric("sink", out.get_usage())
+    report_metric("latency", latency.get_usage())
+    report_metric("policy", policy.get_usage())
+    if adaptive is not None:
+        report_metric("limiter", adaptive.get_usage())
+    return out.total_bytes, failed_counter.count
 
 
 if __name__ == "__main__":
     raised = raise_fd_limit()
     print("Raised fd limit", raised)
 
-    for count in [10, 100, get_openable_fd_for_req()]:
-        print("execution for", count, "threads...\n")
-        program_runner(
-            main,
-            f"{count}_threads_plus_asyncio_with_10_000_urls",
-            get_dir_name(__file__),
-            thread_count=count,
-            descr=f"""Io bound execution using {count} threads plus asyncio loop in each. The experiment fetches 10_000 urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
-        )
-        time.sleep(10)
-
-
+    with bench_server():
+        for count in [10, 100, get_openable_fd_for_req()]:
+            print("execution for", count, "threads...\n")
+            program_runner(
+                main,
+                f"{count}_threads_plus_asyncio_with_10_000_urls",
+                get_dir_name(__file__),
+                run_options=RunOptions(cooldown_seconds=10),
+                thread_count=count,
+                descr=f"""Io bound execution using {count} threads plus asyncio loop in each. The experiment fetches 10_000 urls and stores the response data into a file. The returned values represnt the total bytes received from network and the number of failed requests (>=400 status code or error)."""
+            )
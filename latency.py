@@ -0,0 +1,122 @@
+import math
+import threading
+from dataclasses import dataclass, field
+
+# bucket i holds durations in [_BASE * _GROWTH**i, _BASE * _GROWTH**(i + 1)),
+# that is a relative error below 5% from 1 microsecond upward
+_BASE = 1e-6
+_GROWTH = 2 ** (1 / 8)
+_LOG_GROWTH = math.log(_GROWTH)
+
+
+@dataclass(frozen=True)
+class LatencyUsage:
+    count: int
+    min_seconds: float
+    max_seconds: float
+    average_seconds: float
+    p50_seconds: float
+    p90_seconds: float
+    p99_seconds: float
+    p999_seconds: float
+    buckets: dict = field(default_factory=dict)
+    meaning: dict = field(default_factory=lambda: {
+        "count": "Number of successful requests recorded",
+        "pXX_seconds": "Latency under which XX% of the requests completed, accurate to the bucket width",
+        "buckets": "Upper bound in second of each non empty log bucket mapped to its request count",
+    })
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.total = 0
+        self.sum_seconds = 0.0
+        self.min_seconds = math.inf
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        index = int(math.log(seconds / _BASE) / _LOG_GROWTH) if seconds > _BASE else 0
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum_seconds += seconds
+        if seconds < self.min_seconds:
+            self.min_seconds = seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum_seconds += other.sum_seconds
+        self.min_seconds = min(self.min_seconds, other.min_seconds)
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        return self
+
+    def percentile(self, q: float):
+        if not self.total:
+            return 0.0
+        rank = q / 100 * self.total
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # geometric middle of the bucket, clamped to what was seen
+                value = _BASE * _GROWTH ** (index + 0.5)
+                return min(max(value, self.min_seconds), self.max_seconds)
+        return self.max_seconds
+
+    def get_usage(self):
+        return LatencyUsage(
+            count=self.total,
+            min_seconds=self.min_seconds if self.total else 0.0,
+            max_seconds=self.max_seconds,
+            average_seconds=self.sum_seconds / self.total if self.total else 0.0,
+            p50_seconds=self.percentile(50),
+            p90_seconds=self.percentile(90),
+            p99_seconds=self.percentile(99),
+            p999_seconds=self.percentile(99.9),
+            buckets={
+                _BASE * _GROWTH ** (index + 1): self.counts[index]
+                for index in sorted(self.counts)
+            },
+        )
+
+
+class LatencyRecorder:
+    """
+    Records time to first byte and total latency per request. Each thread
+    writes to its own histograms, merged once the run is over, so recording
+    takes no lock.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._histograms: list[tuple[LatencyHistogram, LatencyHistogram]] = []
+
+    def record(self, ttfb_seconds: float, total_seconds: float):
+        histograms = getattr(self._local, "histograms", None)
+        if histograms is None:
+            histograms = self._local.histograms = (LatencyHistogram(), LatencyHistogram())
+            self._histograms.append(histograms)
+        histograms[0].record(ttfb_seconds)
+        histograms[1].record(total_seconds)
+
+    def add(self, ttfb: LatencyHistogram, total: LatencyHistogram):
+        # histograms recorded somewhere else, like a child process
+        self._histograms.append((ttfb, total))
+
+    def merged(self):
+        ttfb, total = LatencyHistogram(), LatencyHistogram()
+        for thread_ttfb, thread_total in self._histograms:
+            ttfb.merge(thread_ttfb)
+            total.merge(thread_total)
+        return ttfb, total
+
+    def get_usage(self):
+        ttfb, total = self.merged()
+        return {
+            "ttfb": ttfb.get_usage(),
+            "total": total.get_usage(),
+        }
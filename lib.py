@@ -2,23 +2,52 @@ import resource
 import os
 from pathlib import Path
 
-def generate_valid_urls(count=10000):
-    param = "abcdefghijklmnopqrstuvwxyz"
+_PARAM = "abcdefghijklmnopqrstuvwxyz"
+# the query param doubles after every url and starts over once it reaches
+# 1000 bytes, so url i carries the alphabet 2 ** (i % 7) times
+_PARAM_PERIOD = 7
+# bump whenever the urls generated change, corpus files of another version
+# are rebuilt (see corpus.py)
+URL_VERSION = 1
+
+
+def generate_valid_urls(start=10000, stop=None):
+    """
+    Urls start to stop, or 0 to start when called with one argument like
+    range. Any slice can be generated without the urls before it, so
+    every shard of a parallel model sees the urls a sync run would.
+    """
+    if stop is None:
+        start, stop = 0, start
     base_url = os.getenv("BENCH_SERVER_URL", None)
     if base_url == None:
         raise Exception(
             f"Please provide the httpbin server base url as env variable to the process with key: BENCH_SERVER_URL"
         )
 
-    for i in range(count):
-        url = f"http://{base_url}/anything/{i}?query={param}"
+    # same format as generate_valid_paths, inlined for the cpu-bound models
+    for i in range(start, stop):
+        yield f"http://{base_url}/anything/{i}?query={_PARAM * (1 << (i % _PARAM_PERIOD))}"
+
+
+def generate_valid_paths(start=10000, stop=None):
+    """What generate_valid_urls puts after the server address, for any server."""
+    if stop is None:
+        start, stop = 0, start
+    for i in range(start, stop):
+        yield f"/anything/{i}?query={_PARAM * (1 << (i % _PARAM_PERIOD))}"
+
+
+def shard(k: int, n: int, total: int):
+    """(start, stop) of the k-th of n contiguous shards of total items, sizes differ by one at most."""
+    size, remainder = divmod(total, n)
+    start = k * size + min(k, remainder)
+    return start, start + size + (1 if k < remainder else 0)
+
 
-        if len(param.encode()) // 1000 >= 1:
-            param = "abcdefghijklmnopqrstuvwxyz"
-        else:
-            param += param
-        
-        yield url
+def get_url_bytes(start=10000, stop=None):
+    # what the cpu-bound models must count for the same urls
+    return sum(len(url.encode()) for url in generate_valid_urls(start, stop))
 
 
 def get_dir_name(path_str:str):
@@ -0,0 +1,216 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from contention import make_lock
+
+ALGORITHMS = ["aimd", "gradient"]
+
+
+@dataclass(frozen=True)
+class LimiterUsage:
+    algorithm: str
+    initial_limit: int
+    min_limit: int
+    max_limit: int
+    final_limit: int
+    average_limit: float
+    max_in_flight: int
+    dropped_count: int
+    limit_seconds: list[float] = field(default_factory=list)
+    limit_usage: list[int] = field(default_factory=list)
+    meaning: dict = field(default_factory=lambda: {
+        "average_limit": "Limit averaged over the run time",
+        "max_in_flight": "Highest number of requests in flight at once",
+        "dropped_count": "Requests seen as dropped (failed, or slower than the latency target for aimd), they make the limit back off",
+        "limit_usage": "Limit after each change, recorded at most every history_interval, at the matching limit_seconds since the limiter was created",
+    })
+
+
+class AdaptiveLimiter:
+    """
+    Bounds the requests in flight like a semaphore whose size follows what
+    the requests see.
+
+    aimd: like TCP, the limit grows by one per successful request until the
+    first drop (slow start), then by one per round trip. A failed request or
+    one slower than latency_target cuts it by backoff, at most once per
+    round trip since the requests completing right after a cut were sent
+    before it. It only grows while it is in use.
+
+    gradient: every sample_size requests, the limit is scaled by the ratio of
+    the long term latency average over the recent one, clamped to
+    [0.5, 1], plus sqrt(limit) so it keeps probing. Failed requests count as
+    a ratio of 0.5.
+
+    A limiter can be shared by event loops of different threads, waiters
+    are woken on their own loop.
+    """
+
+    def __init__(
+        self,
+        algorithm="gradient",
+        initial_limit=20,
+        min_limit=1,
+        max_limit=1000,
+        backoff=0.5,
+        latency_target: float|None = None,
+        sample_size=20,
+        smoothing=0.5,
+        history_interval=0.05,
+    ) -> None:
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown limiter algorithm: {algorithm}, use one of {ALGORITHMS}")
+        self.algorithm = algorithm
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.dropped_count = 0
+        self._backoff = backoff
+        self._latency_target = latency_target
+        self._sample_size = sample_size
+        self._smoothing = smoothing
+        self._samples: list[float] = []
+        self._failed_in_sample = 0
+        self._long_latency = None
+        self._last_backoff = 0.0
+        self._slow_start = True
+        self._lock = make_lock("limiter")
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._start = time.perf_counter()
+        self._history_interval = history_interval
+        self._limit_seconds = [0.0]
+        self._limit_usage = [int(self.limit)]
+        self._limit_area = 0.0
+        self._last_change = self._start
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self._take()
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, future))
+                except ValueError:
+                    # the slot was handed over as we got cancelled
+                    self.in_flight -= 1
+                    self._wake()
+            raise
+
+    def release(self, latency_seconds: float, ok=True):
+        with self._lock:
+            self.in_flight -= 1
+            if self.algorithm == "aimd":
+                self._update_aimd(latency_seconds, ok)
+            else:
+                self._update_gradient(latency_seconds, ok)
+            self._wake()
+
+    def _take(self):
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.max_in_flight = self.in_flight
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self._take()
+            loop.call_soon_threadsafe(self._hand_over, future)
+
+    def _hand_over(self, future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def _set_limit(self, limit: float):
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        now = time.perf_counter()
+        self._limit_area += self.limit * (now - self._last_change)
+        self._last_change = now
+        changed = int(limit) != int(self.limit)
+        self.limit = limit
+        seconds = now - self._start
+        if changed and seconds - self._limit_seconds[-1] >= self._history_interval:
+            self._limit_seconds.append(seconds)
+            self._limit_usage.append(int(limit))
+
+    def _update_aimd(self, latency_seconds: float, ok: bool):
+        too_slow = (
+            self._latency_target is not None
+            and latency_seconds > self._latency_target
+        )
+        if not ok or too_slow:
+            self.dropped_count += 1
+            now = time.perf_counter()
+            if now - self._last_backoff >= latency_seconds:
+                self._last_backoff = now
+                self._slow_start = False
+                self._set_limit(self.limit * self._backoff)
+        elif self.in_flight * 2 >= self.limit:
+            self._set_limit(self.limit + (1 if self._slow_start else 1 / self.limit))
+
+    def _update_gradient(self, latency_seconds: float, ok: bool):
+        self._samples.append(latency_seconds)
+        if not ok:
+            self.dropped_count += 1
+            self._failed_in_sample += 1
+        if len(self._samples) < self._sample_size:
+            return
+
+        short = sum(self._samples) / len(self._samples)
+        if self._long_latency is None:
+            self._long_latency = short
+        # the long term average moves slowly so a sustained slowdown becomes
+        # the new normal instead of pinning the limit down forever
+        self._long_latency = 0.95 * self._long_latency + 0.05 * short
+        gradient = min(max(self._long_latency / short, 0.5), 1.0)
+        if self._failed_in_sample:
+            gradient = 0.5
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self._set_limit(
+            (1 - self._smoothing) * self.limit + self._smoothing * target
+        )
+        self._samples = []
+        self._failed_in_sample = 0
+
+    def get_usage(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            area = self._limit_area + self.limit * (time.perf_counter() - self._last_change)
+            return LimiterUsage(
+                algorithm=self.algorithm,
+                initial_limit=self.initial_limit,
+                min_limit=self.min_limit,
+                max_limit=self.max_limit,
+                final_limit=int(self.limit),
+                average_limit=area / elapsed if elapsed else self.limit,
+                max_in_flight=self.max_in_flight,
+                dropped_count=self.dropped_count,
+                limit_seconds=list(self._limit_seconds),
+                limit_usage=list(self._limit_usage),
+            )
+
+
+async def run_limited(limiter: AdaptiveLimiter|None, fn, *args):
+    """Await fn(*args), which resolves to True on success, within a slot of limiter."""
+    if limiter is None:
+        return await fn(*args)
+    await limiter.acquire()
+    start = time.perf_counter()
+    ok = False
+    try:
+        ok = await fn(*args)
+        return ok
+    finally:
+        limiter.release(time.perf_counter() - start, ok)
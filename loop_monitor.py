@@ -0,0 +1,286 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from latency import LatencyHistogram
+
+
+@dataclass(frozen=True)
+class SlowCallback:
+    at_seconds: float
+    duration_seconds: float
+    callback: str
+    origin: list[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class LoopUsage:
+    pid: int
+    thread: str
+    probe_interval: float
+    slow_callback_threshold: float
+    probe_count: int
+    lag_average_seconds: float
+    lag_p50_seconds: float
+    lag_p90_seconds: float
+    lag_p99_seconds: float
+    lag_max_seconds: float
+    max_ready_count: int
+    max_task_count: int
+    callback_count: int
+    slow_callback_count: int
+    slow_callback_seconds: float
+    sample_seconds: list[float] = field(default_factory=list)
+    lag_usage: list[float] = field(default_factory=list)
+    ready_usage: list[int] = field(default_factory=list)
+    task_usage: list[int] = field(default_factory=list)
+    slow_callbacks: list[SlowCallback] = field(default_factory=list)
+    meaning: dict = field(default_factory=lambda: {
+        "thread": "Name of the thread running the loop",
+        "lag_XX_seconds": "How late the probe, scheduled every probe_interval, ran: the time a ready callback waits for the loop",
+        "max_ready_count": "Most callbacks seen waiting in the ready queue at once",
+        "max_task_count": "Most unfinished tasks seen on the loop at once",
+        "callback_count": "Callbacks run by the loop while monitored",
+        "slow_callback_count": "Callbacks that ran longer than slow_callback_threshold, blocking the loop",
+        "slow_callback_seconds": "Time in second spent in those slow callbacks",
+        "sample_seconds": "Seconds since the monitor started of each sample of lag_usage (worst lag since the previous sample), ready_usage and task_usage",
+        "slow_callbacks": "The slowest of those callbacks, with the frames of the task they belong to, innermost last",
+    })
+
+
+# Handle._run is patched once for every monitored loop of the process, the
+# loops are told apart by the handle
+_original_run = asyncio.events.Handle._run
+_monitors: dict[asyncio.AbstractEventLoop, "LoopMonitor"] = {}
+_monitors_lock = threading.Lock()
+
+
+def _timed_run(handle):
+    monitor = _monitors.get(handle._loop)
+    if monitor is None:
+        return _original_run(handle)
+    start = time.perf_counter()
+    try:
+        return _original_run(handle)
+    finally:
+        monitor._record_callback(handle, start, time.perf_counter() - start)
+
+
+def _describe(handle):
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        # after a step the coroutine is parked at the await that ended it,
+        # the frames show where the slow step was heading
+        origin = []
+        coro = task.get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is not None:
+                code = frame.f_code
+                origin.append(f"{code.co_filename}:{frame.f_lineno} in {code.co_qualname}")
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        return f"step of {task.get_name()} {task.get_coro().__qualname__}", origin
+
+    code = getattr(callback, "__code__", None) or getattr(
+        getattr(callback, "__func__", None), "__code__", None
+    )
+    name = getattr(callback, "__qualname__", repr(callback))
+    origin = [f"{code.co_filename}:{code.co_firstlineno} in {code.co_qualname}"] if code else []
+    if handle._source_traceback:
+        # only kept in asyncio debug mode, where the callback was scheduled
+        origin = [
+            f"{frame.filename}:{frame.lineno} in {frame.name}"
+            for frame in handle._source_traceback[-5:]
+        ] + origin
+    return name, origin
+
+
+class LoopMonitor:
+    """
+    Watches the health of one event loop, from inside it: a probe scheduled
+    every probe_interval measures how late it runs (the loop lag), samples
+    of the ready queue and task counts are taken every sample_interval, and
+    every callback running longer than slow_callback_threshold is counted,
+    the max_slow_callbacks slowest kept with where they come from.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        probe_interval=0.005,
+        slow_callback_threshold=0.01,
+        sample_interval=0.1,
+        max_slow_callbacks=50,
+    ) -> None:
+        self.loop = loop
+        self.probe_interval = probe_interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self._sample_interval = sample_interval
+        self._max_slow_callbacks = max_slow_callbacks
+        self._thread = threading.current_thread().name
+        self._lag = LatencyHistogram()
+        self._interval_lag = 0.0
+        self._sample_seconds: list[float] = []
+        self._lag_usage: list[float] = []
+        self._ready_usage: list[int] = []
+        self._task_usage: list[int] = []
+        self._slow: list[tuple[float, int, SlowCallback]] = []
+        self._slow_seq = itertools.count()
+        self.callback_count = 0
+        self.slow_callback_count = 0
+        self.slow_callback_seconds = 0.0
+        self._start = 0.0
+        self._next_sample = 0.0
+        self._probe_handle: asyncio.TimerHandle|None = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._next_sample = self._start + self._sample_interval
+        with _monitors_lock:
+            if not _monitors:
+                asyncio.events.Handle._run = _timed_run
+            _monitors[self.loop] = self
+        self._schedule_probe()
+
+    def stop(self):
+        if self._probe_handle is not None:
+            self._probe_handle.cancel()
+            # a loop blocked until now never ran the last probe, its lag
+            # is the one that matters most
+            lag = self.loop.time() - self._probe_handle.when()
+            if lag > 0:
+                self._record_lag(lag)
+            self._probe_handle = None
+            self._sample(time.perf_counter())
+        with _monitors_lock:
+            _monitors.pop(self.loop, None)
+            if not _monitors:
+                asyncio.events.Handle._run = _original_run
+
+    def _schedule_probe(self):
+        expected = self.loop.time() + self.probe_interval
+        self._probe_handle = self.loop.call_at(expected, self._probe, expected)
+
+    def _probe(self, expected: float):
+        self._record_lag(max(self.loop.time() - expected, 0.0))
+        now = time.perf_counter()
+        if now >= self._next_sample:
+            self._sample(now)
+        self._schedule_probe()
+
+    def _record_lag(self, lag: float):
+        self._lag.record(lag)
+        if lag > self._interval_lag:
+            self._interval_lag = lag
+
+    def _sample(self, now: float):
+        self._next_sample = now + self._sample_interval
+        self._sample_seconds.append(now - self._start)
+        self._lag_usage.append(self._interval_lag)
+        self._interval_lag = 0.0
+        # the ready queue is private to BaseEventLoop, uvloop has none
+        self._ready_usage.append(len(getattr(self.loop, "_ready", ())))
+        self._task_usage.append(len(asyncio.all_tasks(self.loop)))
+
+    def _record_callback(self, handle, start: float, duration: float):
+        self.callback_count += 1
+        if duration < self.slow_callback_threshold:
+            return
+        self.slow_callback_count += 1
+        self.slow_callback_seconds += duration
+        if (
+            len(self._slow) >= self._max_slow_callbacks
+            and duration <= self._slow[0][0]
+        ):
+            return
+        name, origin = _describe(handle)
+        entry = (
+            duration,
+            next(self._slow_seq),
+            SlowCallback(start - self._start, duration, name, origin),
+        )
+        if len(self._slow) < self._max_slow_callbacks:
+            heapq.heappush(self._slow, entry)
+        else:
+            heapq.heapreplace(self._slow, entry)
+
+    def get_usage(self):
+        lag = self._lag
+        return LoopUsage(
+            pid=os.getpid(),
+            thread=self._thread,
+            probe_interval=self.probe_interval,
+            slow_callback_threshold=self.slow_callback_threshold,
+            probe_count=lag.total,
+            lag_average_seconds=lag.sum_seconds / lag.total if lag.total else 0.0,
+            lag_p50_seconds=lag.percentile(50),
+            lag_p90_seconds=lag.percentile(90),
+            lag_p99_seconds=lag.percentile(99),
+            lag_max_seconds=lag.max_seconds,
+            max_ready_count=max(self._ready_usage, default=0),
+            max_task_count=max(self._task_usage, default=0),
+            callback_count=self.callback_count,
+            slow_callback_count=self.slow_callback_count,
+            slow_callback_seconds=self.slow_callback_seconds,
+            sample_seconds=self._sample_seconds,
+            lag_usage=self._lag_usage,
+            ready_usage=self._ready_usage,
+            task_usage=self._task_usage,
+            slow_callbacks=[
+                entry for _, _, entry in sorted(self._slow, reverse=True)
+            ],
+        )
+
+
+# set by the runner for the runs asking for it, see monitor_loop
+_config: dict|None = None
+_usages: list[LoopUsage] = []
+_usages_lock = threading.Lock()
+
+
+def enable(**kwargs):
+    """Make monitor_loop watch the loops it is used in, kwargs go to LoopMonitor."""
+    global _config
+    _config = kwargs
+    with _usages_lock:
+        _usages.clear()
+
+
+def disable():
+    """Stop monitoring new loops and return the usage of the loops monitored since enable."""
+    global _config
+    _config = None
+    with _usages_lock:
+        usages = list(_usages)
+        _usages.clear()
+    return usages
+
+
+def add_usages(usages: list[LoopUsage]):
+    # loops monitored somewhere else, like a child process
+    with _usages_lock:
+        _usages.extend(usages)
+
+
+@contextmanager
+def monitor_loop(loop: asyncio.AbstractEventLoop|None = None):
+    """
+    Monitor loop, the running one by default, while enabled, its usage is
+    collected on exit. Does nothing otherwise, so models can always use it.
+    """
+    if _config is None:
+        yield None
+        return
+    monitor = LoopMonitor(loop or asyncio.get_running_loop(), **_config)
+    monitor.start()
+    try:
+        yield monitor
+    finally:
+        monitor.stop()
+        add_usages([monitor.get_usage()])
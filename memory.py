@@ -12,7 +12,14 @@ class MemoryUsage:
     average_usage: float
     recording_interval: float
     usage: list[float] = field(default_factory=list)
+    uss_usage: list[int] = field(default_factory=list)
+    pss_usage: list[int] = field(default_factory=list)
+    children_usage: dict = field(default_factory=dict)
     meaning: dict = field(default_factory=lambda: {
+        "usage": "RSS of the process plus every child process it started during the run",
+        "uss_usage": "Unique set size, memory freed if the processes exited, summed over the process tree",
+        "pss_usage": "Proportional set size, shared pages split between the processes sharing them, summed over the process tree (Linux only)",
+        "children_usage": "RSS, USS and PSS of each child process by pid, first_sample is the index of usage where it was first seen",
         "recording_interval": "Time in second between memory usage record"
     })
 
@@ -20,17 +27,62 @@ class MemoryUsage:
 class MemorySupervisor(Thread):
     _proc = psutil.Process()
 
-    def __init__(self, interval=0.5) -> None:
+    def __init__(self, interval=0.5, proc: psutil.Process|None = None) -> None:
         super().__init__()
+        if proc is not None:
+            self._proc = proc
         self._interval = interval
         self._keep_checking = True
         self.usage = []
+        self.uss_usage = []
+        self.pss_usage = []
+        self.children_usage = {}
+        self._ignored = set()
+        self.cpu_seconds = 0.0
+
+    def _get_tree(self):
+        try:
+            children = self._proc.children(recursive=True)
+        except psutil.Error:
+            children = []
+        return [self._proc] + [c for c in children if c.pid not in self._ignored]
 
     def run(self) -> None:
+        # processes already running (like the local bench server) are not
+        # part of the measured program
+        self._ignored = {
+            p.pid for p in self._proc.children(recursive=True)
+        }
+        start = time.thread_time()
         while self._keep_checking:
-            self.usage.append(self._proc.memory_info().rss)
+            rss = uss = pss = 0
+            for proc in self._get_tree():
+                try:
+                    info = proc.memory_full_info()
+                except psutil.AccessDenied:
+                    info = proc.memory_info()
+                except psutil.Error:
+                    continue
+                rss += info.rss
+                uss += getattr(info, "uss", 0)
+                pss += getattr(info, "pss", 0)
+                if proc is not self._proc:
+                    child = self.children_usage.setdefault(proc.pid, {
+                        "first_sample": len(self.usage),
+                        "rss": [],
+                        "uss": [],
+                        "pss": [],
+                    })
+                    child["rss"].append(info.rss)
+                    child["uss"].append(getattr(info, "uss", 0))
+                    child["pss"].append(getattr(info, "pss", 0))
+            self.usage.append(rss)
+            self.uss_usage.append(uss)
+            self.pss_usage.append(pss)
             time.sleep(self._interval)
-    
+        # CPU time this sampling thread took from the measured process
+        self.cpu_seconds = time.thread_time() - start
+
     def stop_checking(self):
         self._keep_checking = False
 
@@ -40,7 +92,8 @@ class MemorySupervisor(Thread):
             min_usage=min(self.usage),
             average_usage=sum(self.usage) / len(self.usage),
             usage=self.usage,
+            uss_usage=self.uss_usage,
+            pss_usage=self.pss_usage,
+            children_usage=self.children_usage,
             recording_interval=self._interval,
         )
-
-
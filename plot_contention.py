@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Thread Contention Visualization
+
+This script plots how contention grows with the thread count of the thread
+based models, from the runs recorded with RunOptions(contention=True)
+(python -m bench run ... --contention).
+
+Metrics visualized:
+- Context switches per second (voluntary and involuntary)
+- Thread CPU time over thread wall time
+- Time waited on the benchmark's own locks
+"""
+
+from pathlib import Path
+import matplotlib.pyplot as plt
+
+from results import ResultStore
+from runner import RunOptions, get_baseline_params
+
+# contention recorded at the default interval, every other run option and
+# model argument left at its default, only the thread count varies
+CONTENTION_OPTIONS = {
+    'run_options.contention': True,
+    'run_options.contention_interval': RunOptions().contention_interval,
+}
+
+# label -> model and params filters of the runs compared
+CONTENTION_CONFIGS = {
+    'CPU-bound threads (10K URLs)': dict(
+        model='cpu-bound.thread',
+        params=get_baseline_params(url_count=10_000, **CONTENTION_OPTIONS),
+    ),
+    'IO-bound threads (10K URLs)': dict(
+        model='io-bound.thread',
+        params=get_baseline_params(
+            url_count=10_000, stream=False, sink='file', retries=0, hedge=False,
+            pool='default', pipeline=0, **CONTENTION_OPTIONS,
+        ),
+    ),
+}
+COLORS = ['#e74c3c', '#3498db']
+
+
+def extract_contention_metrics(data):
+    """Extract the contention profile of a run, None when it was not recorded."""
+    contention = data.get('model_metrics', {}).get('contention')
+    if not contention:
+        return None
+    elapsed = data['elapsed_seconds']
+    return {
+        'elapsed_seconds': elapsed,
+        'voluntary_per_second': contention['voluntary_ctx_switches'] / elapsed,
+        'involuntary_per_second': contention['involuntary_ctx_switches'] / elapsed,
+        # threads living less than one recording interval are never sampled
+        'cpu_ratio': contention['cpu_ratio'] if contention['threads'] else None,
+        'lock_wait_seconds': contention['lock_wait_seconds'],
+        'locks': {lock['name']: lock['wait_seconds'] for lock in contention['locks']},
+    }
+
+
+def load_contention_data():
+    """Load the latest contention profile of each thread count, by compared model."""
+    data = {}
+
+    with ResultStore() as store:
+        for label, config in CONTENTION_CONFIGS.items():
+            by_threads = {}
+            # newest first so older runs of a thread count are skipped
+            for run in store.query(model=config['model'], params=config['params'], latest=True):
+                if run.concurrency in by_threads:
+                    continue
+                metrics = extract_contention_metrics(run.data)
+                if metrics:
+                    by_threads[run.concurrency] = metrics
+            if by_threads:
+                data[label] = dict(sorted(by_threads.items()))
+
+    return data
+
+
+def plot_ctx_switches(data, ax):
+    """Plot context switches per second against the thread count."""
+    for color, (label, by_threads) in zip(COLORS, data.items()):
+        threads = list(by_threads)
+        ax.plot(threads, [m['voluntary_per_second'] for m in by_threads.values()],
+                marker='o', color=color, linewidth=2, label=f'{label}, voluntary')
+        ax.plot(threads, [m['involuntary_per_second'] for m in by_threads.values()],
+                marker='s', color=color, linewidth=2, linestyle='--', label=f'{label}, involuntary')
+
+    ax.set_xscale('log')
+    ax.set_xlabel('Threads', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Context switches / second', fontsize=12, fontweight='bold')
+    ax.set_title('Context Switches', fontsize=14, fontweight='bold', pad=20)
+    ax.legend(fontsize=9, loc='upper left')
+    ax.grid(alpha=0.3, linestyle='--')
+
+
+def plot_cpu_ratio(data, ax):
+    """Plot the share of their life threads spent on the CPU."""
+    for color, (label, by_threads) in zip(COLORS, data.items()):
+        sampled = {t: m for t, m in by_threads.items() if m['cpu_ratio'] is not None}
+        ax.plot(list(sampled), [m['cpu_ratio'] * 100 for m in sampled.values()],
+                marker='o', color=color, linewidth=2, label=label)
+
+    ax.set_xscale('log')
+    ax.set_ylim(0, 105)
+    ax.set_xlabel('Threads', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Thread CPU time / wall time (%)', fontsize=12, fontweight='bold')
+    ax.set_title('Time Threads Spent Running', fontsize=14, fontweight='bold', pad=20)
+    ax.legend(fontsize=10, loc='upper right')
+    ax.grid(alpha=0.3, linestyle='--')
+
+
+def plot_lock_wait(data, ax):
+    """Plot the time waited on each instrumented lock against the thread count."""
+    for color, (label, by_threads) in zip(COLORS, data.items()):
+        names = sorted({name for m in by_threads.values() for name in m['locks']})
+        for style, name in zip(['-', '--', ':', '-.'], names):
+            ax.plot(list(by_threads), [m['locks'].get(name, 0) for m in by_threads.values()],
+                    marker='o', color=color, linewidth=2, linestyle=style,
+                    label=f'{label}, {name}')
+
+    ax.set_xscale('log')
+    ax.set_xlabel('Threads', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Wait (seconds, summed over threads)', fontsize=12, fontweight='bold')
+    ax.set_title('Lock Wait Time', fontsize=14, fontweight='bold', pad=20)
+    ax.legend(fontsize=9, loc='upper left')
+    ax.grid(alpha=0.3, linestyle='--')
+
+
+def create_individual_plots(data, output_dir):
+    """Create separate, focused plot for each metric."""
+    plots_created = []
+
+    for plot, title, file_name in [
+        (plot_ctx_switches, 'Context Switches by Thread Count', 'contention_ctx_switches.png'),
+        (plot_cpu_ratio, 'Thread CPU Time over Wall Time by Thread Count', 'contention_cpu_ratio.png'),
+        (plot_lock_wait, 'Lock Wait Time by Thread Count', 'contention_lock_wait.png'),
+    ]:
+        fig, ax = plt.subplots(figsize=(10, 7))
+        plot(data, ax)
+        fig.suptitle(f'Thread Contention: {title}', fontsize=14, fontweight='bold', y=0.98)
+        fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+        output_file = output_dir / file_name
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
+        plots_created.append(output_file)
+        plt.close(fig)
+
+    return plots_created
+
+
+def main():
+    """Main execution function."""
+    print("Loading contention profiles...")
+    data = load_contention_data()
+
+    print(f"Found data for:")
+    for label in CONTENTION_CONFIGS:
+        print(f"  - {label}: {len(data.get(label, {}))} thread counts")
+    if not data:
+        print("\nNo run recorded with contention, see RunOptions(contention=True)")
+        return
+
+    print("\nGenerating individual plots for each metric...")
+
+    # Create output directory
+    output_dir = Path(__file__).parent / 'plots'
+    output_dir.mkdir(exist_ok=True)
+
+    plots_created = create_individual_plots(data, output_dir)
+
+    print(f"\n✓ Successfully created {len(plots_created)} plots:")
+    for plot_file in plots_created:
+        print(f"  • {plot_file.name}")
+
+    print(f"\n✓ All plots saved to: {output_dir}/")
+    print("\n✓ Done!")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,17 +12,13 @@ Metrics visualized:
 - Performance comparison across thread counts
 """
 
-import json
 from pathlib import Path
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import numpy as np
 
-
-def load_json_data(file_path):
-    """Load and return JSON data from file."""
-    with open(file_path, 'r') as f:
-        return json.load(f)
+from results import ResultStore
+from runner import get_baseline_params
 
 
 def extract_metrics(data):
@@ -38,30 +34,31 @@ def extract_metrics(data):
     }
 
 
-def load_all_cpu_bound_data():
-    """Load all CPU-bound benchmark results."""
-    json_dir = Path(__file__).parent / 'cpu-bound' / 'json'
-    
+def load_all_cpu_bound_data(url_count=1_00_000):
+    """Load the latest CPU-bound results over url_count URLs from the results store."""
     data = {
         'sync': None,
         'asyncio': None,
         'threads': {}
     }
-    
-    # Load sync data
-    sync_file = json_dir / 'sync_data.json'
-    if sync_file.exists():
-        data['sync'] = extract_metrics(load_json_data(sync_file))
-    
-    # Load asyncio data
-    asyncio_file = json_dir / 'asyncio_data.json'
-    if asyncio_file.exists():
-        data['asyncio'] = extract_metrics(load_json_data(asyncio_file))
-    
-    # Load threading data
-    for thread_file in json_dir.glob('*_threads_data.json'):
-        thread_count = int(thread_file.stem.split('_')[0])
-        data['threads'][thread_count] = extract_metrics(load_json_data(thread_file))
+    # runs with instrumentation or another switch interval are left out
+    params = get_baseline_params(url_count=url_count)
+    
+    with ResultStore() as store:
+        # Load sync data
+        sync_run = store.get_latest(model='cpu-bound.sync', params=params)
+        if sync_run:
+            data['sync'] = extract_metrics(sync_run.data)
+        
+        # Load asyncio data
+        asyncio_run = store.get_latest(model='cpu-bound.asyncio', params=params)
+        if asyncio_run:
+            data['asyncio'] = extract_metrics(asyncio_run.data)
+        
+        # Load threading data, newest first so older runs of a thread count are skipped
+        for run in store.query(model='cpu-bound.thread', params=params, latest=True):
+            if run.concurrency not in data['threads']:
+                data['threads'][run.concurrency] = extract_metrics(run.data)
     
     return data
 
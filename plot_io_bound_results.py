@@ -11,18 +11,44 @@ Metrics visualized:
 - CPU usage (process and system)
 - Memory usage
 - Failed requests
+- Request latency CDF (when recorded)
 """
 
-import json
 from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 
+from results import ResultStore
+from runner import get_baseline_params
 
-def load_json_data(file_path):
-    """Load and return JSON data from file."""
-    with open(file_path, 'r') as f:
-        return json.load(f)
+# the model arguments of the variants (streamed, other sinks, retries,
+# hedging, pipelining) left at their defaults
+PLAIN_IO = {'stream': False, 'retries': 0, 'hedge': False}
+
+# label -> results store filters of the configuration it shows, runs with
+# instrumentation or another variant are left out
+IO_BOUND_CONFIGS = {
+    'Sync\n(1K URLs)': dict(
+        model='io-bound.sync',
+        params=get_baseline_params(url_count=1000, sink='file', pipeline=0, **PLAIN_IO),
+    ),
+    'Asyncio\n(10K URLs)': dict(
+        model='io-bound.asyncio',
+        params=get_baseline_params(
+            url_count=10000, mode='gather', window=None, sink='aiofile', limiter=None, **PLAIN_IO
+        ),
+    ),
+    'Threading\n(100 threads, 10K URLs)': dict(
+        model='io-bound.thread', concurrency=100,
+        params=get_baseline_params(
+            url_count=10000, sink='file', pipeline=0, pool='default', **PLAIN_IO
+        ),
+    ),
+    'Hybrid\n(10 threads + asyncio, 10K URLs)': dict(
+        model='io-bound.thread_plus_asyncio', concurrency=10,
+        params=get_baseline_params(url_count=10000, sink='file', limiter=None, **PLAIN_IO),
+    ),
+}
 
 
 def extract_io_metrics(data):
@@ -39,34 +65,19 @@ def extract_io_metrics(data):
         'cpu_sys_max': data['cpu']['sys_max_usage'],
         'memory_avg_mb': data['memory']['average_usage'] / (1024 * 1024),
         'memory_max_mb': data['memory']['max_usage'] / (1024 * 1024),
+        'latency': data.get('model_metrics', {}).get('latency'),
     }
 
 
 def load_io_bound_data():
-    """Load specific IO-bound benchmark results for comparison."""
-    json_dir = Path(__file__).parent / 'io-bound' / 'json'
-    
+    """Load the latest result of each compared IO-bound configuration from the results store."""
     data = {}
     
-    # Sync: 1,000 URLs
-    sync_file = json_dir / 'sync_data_with_1000_urls.json'
-    if sync_file.exists():
-        data['Sync\n(1K URLs)'] = extract_io_metrics(load_json_data(sync_file))
-    
-    # Asyncio: 10,000 URLs
-    asyncio_file = json_dir / 'asyncio_data_with_10000_urls.json'
-    if asyncio_file.exists():
-        data['Asyncio\n(10K URLs)'] = extract_io_metrics(load_json_data(asyncio_file))
-    
-    # Threading: 100 threads with 10,000 URLs
-    thread_file = json_dir / '100_threads_data_with_10_000_urls.json'
-    if thread_file.exists():
-        data['Threading\n(100 threads, 10K URLs)'] = extract_io_metrics(load_json_data(thread_file))
-    
-    # Hybrid: 10 threads + asyncio with 10,000 URLs
-    hybrid_file = json_dir / '10_threads_plus_asyncio_with_10_000_urls.json'
-    if hybrid_file.exists():
-        data['Hybrid\n(10 threads + asyncio, 10K URLs)'] = extract_io_metrics(load_json_data(hybrid_file))
+    with ResultStore() as store:
+        for label, filters in IO_BOUND_CONFIGS.items():
+            run = store.get_latest(**filters)
+            if run:
+                data[label] = extract_io_metrics(run.data)
     
     return data
 
@@ -191,6 +202,33 @@ def plot_failed_requests(data, ax):
     plt.setp(ax.xaxis.get_majorticklabels(), rotation=15, ha='right')
 
 
+def plot_latency_cdf(data, ax):
+    """Plot total request latency CDFs from the recorded histogram buckets."""
+    colors = ['#2ecc71', '#3498db', '#e74c3c', '#f39c12']
+    
+    for model, color in zip(data.keys(), colors):
+        latency = data[model]['latency']
+        if not latency:
+            continue
+        total = latency['total']
+        bounds = [float(bound) * 1000 for bound in total['buckets']]
+        cumulative = np.cumsum(list(total['buckets'].values())) / total['count']
+        label = model.replace('\n', ' ')
+        ax.step(bounds, cumulative, where='post', color=color, linewidth=2,
+                label=f"{label} (p99 {total['p99_seconds'] * 1000:.1f} ms)")
+    
+    for q in [0.5, 0.9, 0.99]:
+        ax.axhline(q, color='grey', alpha=0.4, linestyle=':')
+    
+    ax.set_xscale('log')
+    ax.set_xlabel('Request latency (ms, log scale)', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Share of requests', fontsize=12, fontweight='bold')
+    ax.set_title('Request Latency CDF', fontsize=14, fontweight='bold', pad=20)
+    ax.set_ylim(0, 1.02)
+    ax.legend(fontsize=9, loc='lower right')
+    ax.grid(alpha=0.3, linestyle='--')
+
+
 def create_individual_plots(data, output_dir):
     """Create separate, focused plot for each metric."""
     plots_created = []
@@ -250,6 +288,18 @@ def create_individual_plots(data, output_dir):
     plots_created.append(output_file5)
     plt.close(fig5)
     
+    # 6. Latency CDF Plot, only for results recorded with latency histograms
+    if any(metrics['latency'] for metrics in data.values()):
+        fig6, ax6 = plt.subplots(figsize=(12, 7))
+        plot_latency_cdf(data, ax6)
+        fig6.suptitle('IO-Bound Execution: Request Latency Distribution\n(HTTP Requests)',
+                      fontsize=14, fontweight='bold', y=0.98)
+        fig6.tight_layout(rect=[0, 0.03, 1, 0.95])
+        output_file6 = output_dir / 'io_bound_latency_cdf.png'
+        fig6.savefig(output_file6, dpi=300, bbox_inches='tight')
+        plots_created.append(output_file6)
+        plt.close(fig6)
+    
     return plots_created
 
 
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+GIL Switch Interval Visualization
+
+This script plots heatmaps of the thread based models over the GIL switch
+interval (sys.setswitchinterval) and the thread count, from the runs of a
+sweep like:
+
+    python -m bench run --models cpu-bound.thread io-bound.thread --url-counts 10000 \\
+        --threads 1 4 16 64 --switch-intervals 0.0005 0.001 0.005 0.02 0.1
+
+Metrics visualized:
+- Execution time
+- Process CPU usage
+- Request latency percentiles (IO-bound)
+"""
+
+from pathlib import Path
+import matplotlib.pyplot as plt
+import numpy as np
+
+from results import ResultStore
+from runner import get_baseline_params
+
+
+def get_sweep_params(**params):
+    """Filters of runs with default run options but for the switch interval."""
+    params = get_baseline_params(**params)
+    # any interval, the runs without one are skipped when loading
+    del params['run_options.switch_interval']
+    return params
+
+
+# label -> model and params filters of the runs compared, every model
+# argument but the thread count left at its default
+SWITCH_INTERVAL_CONFIGS = {
+    'CPU-Bound Threads (10K URLs)': dict(
+        model='cpu-bound.thread',
+        params=get_sweep_params(url_count=10_000),
+        file_name='switch_interval_cpu_bound.png',
+    ),
+    'IO-Bound Threads (10K URLs)': dict(
+        model='io-bound.thread',
+        params=get_sweep_params(
+            url_count=10_000, stream=False, sink='file', retries=0, hedge=False,
+            pool='default', pipeline=0,
+        ),
+        file_name='switch_interval_io_bound.png',
+    ),
+}
+
+
+def extract_switch_metrics(data):
+    """Extract the metrics shown in the heatmaps."""
+    latency = data.get('model_metrics', {}).get('latency')
+    return {
+        'elapsed_seconds': data['elapsed_seconds'],
+        'cpu_proc_avg': data['cpu']['proc_average_usage'],
+        'latency_p50_ms': latency['total']['p50_seconds'] * 1000 if latency else None,
+        'latency_p99_ms': latency['total']['p99_seconds'] * 1000 if latency else None,
+    }
+
+
+def load_switch_interval_data():
+    """Load the latest run of each (switch interval, thread count), by compared model."""
+    data = {}
+
+    with ResultStore() as store:
+        for label, config in SWITCH_INTERVAL_CONFIGS.items():
+            cells = {}
+            # newest first so older runs of a configuration are skipped
+            for run in store.query(model=config['model'], params=config['params'], latest=True):
+                # runs without the sweep used the interpreter's interval
+                interval = run.params.get('run_options', {}).get('switch_interval')
+                if interval is None or (interval, run.concurrency) in cells:
+                    continue
+                cells[(interval, run.concurrency)] = extract_switch_metrics(run.data)
+            if cells:
+                data[label] = cells
+
+    return data
+
+
+def plot_heatmap(cells, metric, title, unit, ax):
+    """Plot one metric over switch interval (rows) and thread count (columns)."""
+    intervals = sorted({interval for interval, _ in cells})
+    threads = sorted({thread_count for _, thread_count in cells})
+    values = np.full((len(intervals), len(threads)), np.nan)
+    for (interval, thread_count), metrics in cells.items():
+        if metrics[metric] is not None:
+            values[intervals.index(interval), threads.index(thread_count)] = metrics[metric]
+
+    image = ax.imshow(values, cmap='RdYlGn_r', aspect='auto')
+    ax.figure.colorbar(image, ax=ax, label=unit)
+    ax.set_xticks(range(len(threads)))
+    ax.set_xticklabels(threads)
+    ax.set_yticks(range(len(intervals)))
+    ax.set_yticklabels([f'{interval * 1000:g} ms' for interval in intervals])
+    ax.set_xlabel('Threads', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Switch interval', fontsize=12, fontweight='bold')
+    ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+
+    # Add value labels in the cells
+    for row in range(len(intervals)):
+        for column in range(len(threads)):
+            if not np.isnan(values[row, column]):
+                ax.text(column, row, f'{values[row, column]:.3g}',
+                        ha='center', va='center', fontsize=9, fontweight='bold')
+
+
+def create_individual_plots(data, output_dir):
+    """Create one figure of heatmaps per compared model."""
+    plots_created = []
+
+    for label, cells in data.items():
+        panels = [
+            ('elapsed_seconds', 'Execution Time', 'seconds'),
+            ('cpu_proc_avg', 'Process CPU (Average)', '%'),
+        ]
+        if any(metrics['latency_p50_ms'] is not None for metrics in cells.values()):
+            panels += [
+                ('latency_p50_ms', 'Request Latency p50', 'ms'),
+                ('latency_p99_ms', 'Request Latency p99', 'ms'),
+            ]
+
+        fig, axes = plt.subplots(1, len(panels), figsize=(8 * len(panels), 7))
+        for ax, (metric, title, unit) in zip(axes, panels):
+            plot_heatmap(cells, metric, title, unit, ax)
+        fig.suptitle(f'{label}: GIL Switch Interval by Thread Count',
+                     fontsize=16, fontweight='bold', y=0.98)
+        fig.tight_layout(rect=[0, 0.03, 1, 0.93])
+        output_file = output_dir / SWITCH_INTERVAL_CONFIGS[label]['file_name']
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
+        plots_created.append(output_file)
+        plt.close(fig)
+
+    return plots_created
+
+
+def main():
+    """Main execution function."""
+    print("Loading switch interval sweep data...")
+    data = load_switch_interval_data()
+
+    print(f"Found data for:")
+    for label in SWITCH_INTERVAL_CONFIGS:
+        print(f"  - {label}: {len(data.get(label, {}))} configurations")
+    if not data:
+        print("\nNo run recorded with a switch interval, see python -m bench run --switch-intervals")
+        return
+
+    print("\nGenerating heatmaps...")
+
+    # Create output directory
+    output_dir = Path(__file__).parent / 'plots'
+    output_dir.mkdir(exist_ok=True)
+
+    plots_created = create_individual_plots(data, output_dir)
+
+    print(f"\n✓ Successfully created {len(plots_created)} plots:")
+    for plot_file in plots_created:
+        print(f"  • {plot_file.name}")
+
+    print(f"\n✓ All plots saved to: {output_dir}/")
+    print("\n✓ Done!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import asyncio
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from contention import make_lock
+from latency import LatencyHistogram
+
+# statuses worth another attempt, anything else is a final answer
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class PolicyUsage:
+    retries_allowed: int
+    hedge: bool
+    request_count: int
+    retry_count: int
+    retried_count: int
+    recovered_count: int
+    budget_denied_count: int
+    hedged_count: int
+    hedge_win_count: int
+    hedge_delay_seconds: float|None
+    meaning: dict = field(default_factory=lambda: {
+        "request_count": "Requests made through the policy, 0 without retries nor hedging since they then skip it",
+        "retry_count": "Attempts made after the first one, over every request",
+        "retried_count": "Requests that needed at least one retry",
+        "recovered_count": "Retried requests that ended with a successful response",
+        "budget_denied_count": "Retries not made because the retry budget was spent",
+        "hedged_count": "Requests that got a duplicate because the first attempt was slower than the hedge delay",
+        "hedge_win_count": "Hedged requests answered by the duplicate first",
+        "hedge_delay_seconds": "Last hedge delay used, the hedge_quantile of the time to first byte seen so far",
+    })
+
+
+class RequestPolicy:
+    """
+    Retries and hedging shared by the requests and aiohttp models, one
+    instance per run, safe to share between threads.
+
+    A failed attempt (error or status in RETRY_STATUSES) is retried up to
+    retries times after a full jitter exponential backoff. Every request
+    adds retry_budget to a bucket a retry takes one token from, so retries
+    stay a bounded share of the traffic when the server is down.
+
+    With hedge, an attempt still waiting for its response after the
+    hedge_quantile of the time to first byte gets a duplicate, the first
+    response is kept and the other one dropped. Both race for headers only,
+    bodies are read once from the winner.
+
+    Without retries nor hedging requests go straight to the session, with
+    no lock taken nor anything recorded, so the plain runs of the models
+    cost what they did before the policy.
+    """
+
+    def __init__(
+        self,
+        retries=0,
+        hedge=False,
+        backoff_base=0.01,
+        backoff_max=1.0,
+        retry_budget=0.2,
+        hedge_quantile=95,
+        hedge_min_samples=50,
+        hedge_workers=64,
+    ) -> None:
+        self.retries = retries
+        self.hedge = hedge
+        self.active = bool(retries or hedge)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._retry_budget = retry_budget
+        # a few tokens upfront so the first failures can be retried
+        self._tokens = 10.0
+        self._hedge_quantile = hedge_quantile
+        self._hedge_min_samples = hedge_min_samples
+        self._hedge_workers = hedge_workers
+        self._executor: ThreadPoolExecutor|None = None
+        self._hedge_delay = None
+        if self.active:
+            self._ttfb = LatencyHistogram()
+            self._lock = make_lock("policy")
+        self.request_count = 0
+        self.retry_count = 0
+        self.retried_count = 0
+        self.recovered_count = 0
+        self.budget_denied_count = 0
+        self.hedged_count = 0
+        self.hedge_win_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _start_request(self):
+        with self._lock:
+            self.request_count += 1
+            self._tokens = min(self._tokens + self._retry_budget, 100.0)
+
+    def _take_retry(self, attempt: int):
+        with self._lock:
+            if self._tokens < 1:
+                self.budget_denied_count += 1
+                return False
+            self._tokens -= 1
+            self.retry_count += 1
+            if attempt == 0:
+                self.retried_count += 1
+            return True
+
+    def _end_request(self, attempt: int, ok: bool):
+        if attempt and ok:
+            with self._lock:
+                self.recovered_count += 1
+
+    def _backoff(self, attempt: int):
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+
+    def _record(self, seconds: float):
+        with self._lock:
+            self._ttfb.record(seconds)
+            if self._ttfb.total >= self._hedge_min_samples:
+                self._hedge_delay = self._ttfb.percentile(self._hedge_quantile)
+
+    def _get_hedge_delay(self):
+        return self._hedge_delay if self.hedge else None
+
+    def _count_hedged(self):
+        with self._lock:
+            self.hedged_count += 1
+
+    def _count_hedge_win(self):
+        with self._lock:
+            self.hedge_win_count += 1
+
+    def get(self, session, url: str, stream=False):
+        """session.get(url) with the policy applied, the response is the caller's to close."""
+        if not self.active:
+            return session.get(url, stream=stream)
+        self._start_request()
+        attempt = 0
+        while 1:
+            error = response = None
+            try:
+                response = self._get_hedged(session, url, stream)
+            except Exception as e:
+                error = e
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                self._end_request(attempt, response.ok)
+                return response
+            if attempt >= self.retries or not self._take_retry(attempt):
+                self._end_request(attempt, False)
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _get_hedged(self, session, url: str, stream: bool):
+        delay = self._get_hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            # hedged runs always time headers only, like the hedged attempts
+            response = session.get(url, stream=stream or self.hedge)
+            self._record(time.perf_counter() - start)
+            return response
+
+        # both attempts only wait for headers, the winner's body is read by
+        # the caller
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._hedge_workers)
+        primary = self._executor.submit(session.get, url, stream=True)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            response = primary.result()
+            self._record(time.perf_counter() - start)
+            return response
+
+        self._count_hedged()
+        hedge = self._executor.submit(session.get, url, stream=True)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is None:
+                continue
+            self._record(time.perf_counter() - start)
+            if winner is hedge:
+                self._count_hedge_win()
+            for loser in {primary, hedge} - {winner}:
+                loser.add_done_callback(_close_response)
+            return winner.result()
+        return primary.result()
+
+    def aget(self, client, url: str):
+        """client.get(url) with the policy applied, to await, the response is the caller's to release."""
+        if not self.active:
+            return client.get(url)
+        return self._aget(client, url)
+
+    async def _aget(self, client, url: str):
+        self._start_request()
+        attempt = 0
+        while 1:
+            error = response = None
+            try:
+                response = await self._aget_hedged(client, url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            if response is not None and response.status not in RETRY_STATUSES:
+                self._end_request(attempt, response.ok)
+                return response
+            if attempt >= self.retries or not self._take_retry(attempt):
+                self._end_request(attempt, False)
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.release()
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _aget_hedged(self, client, url: str):
+        delay = self._get_hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            response = await client.get(url)
+            self._record(time.perf_counter() - start)
+            return response
+
+        primary = asyncio.ensure_future(client.get(url))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                response = primary.result()
+                self._record(time.perf_counter() - start)
+                return response
+
+            self._count_hedged()
+            hedge = asyncio.ensure_future(client.get(url))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is None:
+                    continue
+                self._record(time.perf_counter() - start)
+                if winner is hedge:
+                    self._count_hedge_win()
+                for loser in {primary, hedge} - {winner}:
+                    if loser.done() and loser.exception() is None:
+                        loser.result().release()
+                return winner.result()
+            return primary.result()
+        finally:
+            # the losing attempt, or both when cancelled, must not linger
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def get_usage(self):
+        if not self.active:
+            return self._get_usage()
+        with self._lock:
+            return self._get_usage()
+
+    def _get_usage(self):
+        return PolicyUsage(
+            retries_allowed=self.retries,
+            hedge=self.hedge,
+            request_count=self.request_count,
+            retry_count=self.retry_count,
+            retried_count=self.retried_count,
+            recovered_count=self.recovered_count,
+            budget_denied_count=self.budget_denied_count,
+            hedged_count=self.hedged_count,
+            hedge_win_count=self.hedge_win_count,
+            hedge_delay_seconds=self._hedge_delay,
+        )
+
+
+def _close_response(future: Future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,140 @@
+import queue
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# default: one Session as requests builds it, a pool of 10 connections
+# shared: one Session whose pool holds a connection per thread
+# per_thread: one Session, and so one pool, per thread
+# sharded: threads spread over a few Sessions, each pool sized for its threads
+POOL_STRATEGIES = ["default", "shared", "per_thread", "sharded"]
+
+
+@dataclass(frozen=True)
+class PoolUsage:
+    strategy: str
+    session_count: int
+    pool_maxsize: int
+    new_connection_count: int
+    request_count: int
+    reused_connection_count: int
+    discarded_connection_count: int
+    reuse_ratio: float
+    meaning: dict = field(default_factory=lambda: {
+        "pool_maxsize": "Connections each Session keeps for reuse",
+        "new_connection_count": "Connections opened, over every Session",
+        "reused_connection_count": "Requests sent on a connection already opened by an earlier request",
+        "discarded_connection_count": "Connections closed after one use because their pool was already full, the cost of an undersized pool",
+        "reuse_ratio": "reused_connection_count / request_count",
+    })
+
+
+class _CountingPoolMixin:
+    # the pool only logs the connections it has no room for, count them
+    discarded_count = 0
+
+    def _put_conn(self, conn):
+        if conn is not None and self.pool is not None:
+            try:
+                self.pool.put(conn, block=False)
+                return
+            except queue.Full:
+                # closed here, the base class would try the put again and
+                # could keep a connection counted as discarded
+                self.discarded_count += 1
+                conn.close()
+                return
+            except AttributeError:
+                # closed meanwhile, the pool closes the connection
+                pass
+        super()._put_conn(conn)
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class CountingAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def get_pools(self):
+        manager = self.poolmanager
+        return [manager.pools[key] for key in manager.pools.keys()]
+
+
+class SessionPools:
+    """
+    Hands each worker thread the requests Session of the chosen strategy and
+    counts how the connections behind them were used.
+
+    Call session(k) from worker k, k in range(thread_count). Usage must be
+    read before close, which drops the pools.
+    """
+
+    def __init__(self, strategy="default", thread_count=1, shard_count=4) -> None:
+        if strategy not in POOL_STRATEGIES:
+            raise ValueError(f"Unknown pool strategy: {strategy}, use one of {POOL_STRATEGIES}")
+        self.strategy = strategy
+        self.thread_count = thread_count
+        if strategy == "default":
+            session_count, self.pool_maxsize = 1, DEFAULT_POOLSIZE
+        elif strategy == "shared":
+            session_count, self.pool_maxsize = 1, thread_count
+        elif strategy == "per_thread":
+            session_count, self.pool_maxsize = thread_count, 1
+        else:
+            session_count = min(shard_count, thread_count)
+            self.pool_maxsize = -(-thread_count // session_count)
+        self._sessions = [self._new_session() for _ in range(session_count)]
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = CountingAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def session(self, k: int):
+        # contiguous blocks so a shard serves neighbouring workers
+        return self._sessions[k * len(self._sessions) // self.thread_count]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+
+    def get_usage(self):
+        new_count = request_count = discarded_count = 0
+        for session in self._sessions:
+            for pool in session.get_adapter("http://").get_pools():
+                new_count += pool.num_connections
+                request_count += pool.num_requests
+                discarded_count += pool.discarded_count
+        reused_count = max(request_count - new_count, 0)
+        return PoolUsage(
+            strategy=self.strategy,
+            session_count=len(self._sessions),
+            pool_maxsize=self.pool_maxsize,
+            new_connection_count=new_count,
+            request_count=request_count,
+            reused_connection_count=reused_count,
+            discarded_connection_count=discarded_count,
+            reuse_ratio=reused_count / request_count if request_count else 0.0,
+        )
@@ -0,0 +1,188 @@
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field, replace
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STDLIB = sysconfig.get_paths()["stdlib"]
+
+
+@dataclass(frozen=True)
+class FunctionUsage:
+    function: str
+    self_samples: int
+    total_samples: int
+    self_ratio: float
+    total_ratio: float
+
+
+@dataclass(frozen=True)
+class ProfileUsage:
+    rate: float
+    idle_included: bool
+    tick_count: int
+    sample_count: int
+    thread_samples: dict = field(default_factory=dict)
+    hottest: list[FunctionUsage] = field(default_factory=list)
+    folded_path: str|None = None
+    thread_folded_path: str|None = None
+    # thread name -> folded stack -> samples, written out by write_folded
+    stacks: dict = field(default_factory=dict)
+    meaning: dict = field(default_factory=lambda: {
+        "rate": "Stack samples per second asked for, every thread is sampled at each tick",
+        "idle_included": "Whether samples of threads that used no CPU since the previous tick were kept",
+        "tick_count": "Times the stacks of every thread were taken",
+        "sample_count": "Thread stacks kept over the run",
+        "thread_samples": "Samples kept by thread name",
+        "hottest": "Functions with the most samples on top of the stack (self) and anywhere in it (total), ratios of sample_count",
+        "folded_path": "Folded stacks of the run, one 'frame;frame;... count' line per stack, for flamegraph.pl or speedscope",
+        "thread_folded_path": "The same stacks under a root frame naming their thread",
+    })
+
+
+def short_path(filename: str):
+    """filename relative to site-packages, the repository or the stdlib."""
+    if "site-packages" + os.sep in filename:
+        return filename.split("site-packages" + os.sep, 1)[1]
+    for root in (ROOT, STDLIB):
+        if filename.startswith(root + os.sep):
+            return os.path.relpath(filename, root)
+    return filename
+
+
+def describe_code(code):
+    # ";" separates the frames of a folded stack
+    return f"{code.co_qualname} ({short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackProfiler:
+    """
+    Samples the Python stack of every thread of the process with
+    sys._current_frames(), driven by the tick of a sampling thread (see
+    CpuSupervisor). Stacks are kept as tuples of code objects and only
+    named once the run is over, so a tick costs little more than walking
+    the frames.
+
+    By default the samples of a thread that used no CPU since the previous
+    tick are dropped: a thread blocked on IO, a lock or the GIL would
+    otherwise make join and wait the hottest functions of every run.
+    """
+
+    def __init__(self, rate=100.0, idle=False, root=None, max_hottest=20) -> None:
+        self.rate = rate
+        # stacks going through this code object start at it, the frames
+        # of whatever called it are the same in every sample
+        self._root = root
+        self.interval = 1 / rate
+        self.idle = idle
+        self._max_hottest = max_hottest
+        # the sampling thread, see ignore_current_thread
+        self._ignored: set[int] = set()
+        self._thread_cpu: dict[int, float] = {}
+        # (thread name, code objects, outermost first) -> samples
+        self._stacks: Counter = Counter()
+        self.tick_count = 0
+
+    def ignore_current_thread(self):
+        self._ignored.add(threading.get_ident())
+
+    def _used_cpu(self, ident: int):
+        if self.idle or not hasattr(time, "pthread_getcpuclockid"):
+            return True
+        try:
+            # the thread holds a thread state, so it is still running,
+            # while this one holds the GIL
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except OSError:
+            return True
+        previous = self._thread_cpu.get(ident)
+        self._thread_cpu[ident] = cpu
+        return previous is None or cpu > previous
+
+    def sample(self):
+        self.tick_count += 1
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in self._ignored or not self._used_cpu(ident):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self._stacks[names.get(ident, str(ident)), tuple(stack)] += 1
+
+    def get_usage(self):
+        names = {}
+        stacks: dict[str, Counter] = {}
+        self_samples = Counter()
+        total_samples = Counter()
+        for (thread, codes), count in self._stacks.items():
+            if self._root in codes:
+                codes = codes[codes.index(self._root):]
+            frames = []
+            for code in codes:
+                if code not in names:
+                    names[code] = describe_code(code)
+                frames.append(names[code])
+            stacks.setdefault(thread, Counter())[";".join(frames)] += count
+            self_samples[frames[-1]] += count
+            # a recursive function counts once per sample
+            for name in set(frames):
+                total_samples[name] += count
+
+        sample_count = sum(self._stacks.values())
+        return ProfileUsage(
+            rate=self.rate,
+            idle_included=self.idle,
+            tick_count=self.tick_count,
+            sample_count=sample_count,
+            thread_samples={
+                thread: sum(counts.values()) for thread, counts in stacks.items()
+            },
+            hottest=[
+                FunctionUsage(
+                    function=name,
+                    self_samples=count,
+                    total_samples=total_samples[name],
+                    self_ratio=count / sample_count,
+                    total_ratio=total_samples[name] / sample_count,
+                )
+                for name, count in self_samples.most_common(self._max_hottest)
+            ],
+            stacks={thread: dict(counts) for thread, counts in stacks.items()},
+        )
+
+
+def write_folded(usage: ProfileUsage, path: str):
+    """
+    Write the stacks of usage to path.folded, merged over threads, and to
+    path.threads.folded under a root frame per thread. Returns usage with
+    the paths in place of the stacks.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    merged = Counter()
+    for counts in usage.stacks.values():
+        merged.update(counts)
+
+    folded_path = f"{path}.folded"
+    with open(folded_path, "w") as f:
+        for stack, count in merged.most_common():
+            f.write(f"{stack} {count}\n")
+
+    thread_folded_path = f"{path}.threads.folded"
+    with open(thread_folded_path, "w") as f:
+        for thread, counts in sorted(usage.stacks.items()):
+            thread = thread.replace(";", ",")
+            for stack, count in sorted(counts.items(), key=lambda item: -item[1]):
+                f.write(f"{thread};{stack} {count}\n")
+
+    return replace(
+        usage,
+        folded_path=folded_path,
+        thread_folded_path=thread_folded_path,
+        stacks={},
+    )
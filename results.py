@@ -0,0 +1,340 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import time
+from array import array
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(ROOT, "results", "results.db")
+
+# numeric lists at least this long are stored as typed array blobs, shorter
+# ones (like returned values) cost less inline in the run document
+MIN_SERIES_LENGTH = 8
+SERIES_MARKER = "$series"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    concurrency INTEGER,
+    git_rev TEXT,
+    created_at REAL NOT NULL,
+    elapsed_seconds REAL,
+    params TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_config ON runs (model, workload, concurrency, git_rev);
+CREATE INDEX IF NOT EXISTS runs_by_name ON runs (workload, name);
+CREATE TABLE IF NOT EXISTS series (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    typecode TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run_id, path)
+) WITHOUT ROWID;
+"""
+
+
+@lru_cache(maxsize=1)
+def get_git_rev():
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{rev}-dirty" if dirty else rev
+
+
+def is_series(value):
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) >= MIN_SERIES_LENGTH
+        and all(
+            isinstance(v, (int, float)) and not isinstance(v, bool)
+            for v in value
+        )
+    )
+
+
+def split_series(data, path="", series=None):
+    # returns a copy of data with every series replaced by a marker, and the
+    # series found as path -> array
+    if series is None:
+        series = {}
+    if is_series(data):
+        typecode = "q" if all(isinstance(v, int) for v in data) else "d"
+        try:
+            series[path] = array(typecode, data)
+        except OverflowError:
+            series[path] = array("d", data)
+        return {SERIES_MARKER: path}, series
+    if isinstance(data, dict):
+        return {
+            k: split_series(v, f"{path}.{k}" if path else str(k), series)[0]
+            for k, v in data.items()
+        }, series
+    if isinstance(data, (list, tuple)):
+        return [
+            split_series(v, f"{path}.{i}" if path else str(i), series)[0]
+            for i, v in enumerate(data)
+        ], series
+    return data, series
+
+
+def join_series(data, series: dict):
+    if isinstance(data, dict):
+        if SERIES_MARKER in data and len(data) == 1:
+            return series[data[SERIES_MARKER]].tolist()
+        return {k: join_series(v, series) for k, v in data.items()}
+    if isinstance(data, list):
+        return [join_series(v, series) for v in data]
+    return data
+
+
+def get_concurrency(kwargs: dict):
+    for key in ("thread_count", "process_count", "window"):
+        if kwargs.get(key) is not None:
+            return kwargs[key]
+    return None
+
+
+@dataclass
+class Run:
+    store: "ResultStore" = field(repr=False)
+    id: int
+    name: str
+    model: str
+    workload: str
+    concurrency: int|None
+    git_rev: str|None
+    created_at: float
+    elapsed_seconds: float|None
+    params: dict
+
+    @cached_property
+    def data(self):
+        # run document without its series, which stay as markers until asked for
+        row = self.store.conn.execute(
+            "SELECT data FROM runs WHERE id = ?", (self.id,)
+        ).fetchone()
+        return json.loads(row[0])
+
+    def series(self, path: str):
+        row = self.store.conn.execute(
+            "SELECT typecode, data FROM series WHERE run_id = ? AND path = ?",
+            (self.id, path),
+        ).fetchone()
+        if row is None:
+            return None
+        values = array(row[0])
+        values.frombytes(row[1])
+        return values
+
+    def get(self, path: str):
+        value = self.data
+        for key in path.split("."):
+            if isinstance(value, list) and key.isdigit() and int(key) < len(value):
+                value = value[int(key)]
+            elif isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                return None
+        if isinstance(value, dict) and SERIES_MARKER in value:
+            return self.series(value[SERIES_MARKER])
+        return value
+
+    def load(self):
+        # the whole run as program_runner returned it
+        series = {}
+        for path, typecode, blob in self.store.conn.execute(
+            "SELECT path, typecode, data FROM series WHERE run_id = ?", (self.id,)
+        ):
+            values = array(typecode)
+            values.frombytes(blob)
+            series[path] = values
+        return join_series(self.data, series)
+
+
+class ResultStore:
+    """
+    SQLite store of every run. The runs table keeps the configuration as
+    indexed columns and the metrics as a JSON document, sample series live
+    in their own table as typed array blobs and are read only when asked for.
+    """
+
+    def __init__(self, path=DB_PATH) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_run(
+        self,
+        name: str,
+        data: dict,
+        *,
+        model: str,
+        workload: str,
+        concurrency: int|None = None,
+        params: dict|None = None,
+    ):
+        doc, series = split_series(data)
+        with self.conn:
+            cursor = self.conn.execute(
+                """
+                INSERT INTO runs (
+                    name, model, workload, concurrency, git_rev,
+                    created_at, elapsed_seconds, params, data
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    name,
+                    model,
+                    workload,
+                    concurrency,
+                    get_git_rev(),
+                    time.time(),
+                    data.get("elapsed_seconds"),
+                    json.dumps(params or {}, sort_keys=True, default=str),
+                    json.dumps(doc, default=str),
+                ),
+            )
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO series (run_id, path, typecode, data) VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, path, values.typecode, values.tobytes())
+                    for path, values in series.items()
+                ],
+            )
+        return run_id
+
+    def query(
+        self,
+        *,
+        run_id: int|None = None,
+        name: str|None = None,
+        model: str|None = None,
+        workload: str|None = None,
+        concurrency: int|None = None,
+        git_rev: str|None = None,
+        params: dict|None = None,
+        latest=False,
+    ):
+        """
+        Runs matching every given filter, newest first. params filters on
+        the model arguments, a dotted key on a nested one (like
+        "run_options.contention") and None on a missing or null one. latest
+        keeps only the newest run of each configuration.
+        """
+        where, args = [], []
+        for column, value in (
+            ("id", run_id),
+            ("name", name),
+            ("model", model),
+            ("workload", workload),
+            ("concurrency", concurrency),
+            ("git_rev", git_rev),
+        ):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        for key, value in (params or {}).items():
+            if value is None:
+                where.append("json_extract(params, ?) IS NULL")
+                args.append(f"$.{key}")
+            else:
+                where.append("json_extract(params, ?) = ?")
+                args.extend([f"$.{key}", value])
+        if latest:
+            where.append(
+                "id IN (SELECT MAX(id) FROM runs GROUP BY model, workload, params)"
+            )
+
+        sql = """
+            SELECT id, name, model, workload, concurrency, git_rev,
+                   created_at, elapsed_seconds, params
+            FROM runs
+        """
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC"
+        return [
+            Run(self, *row[:-1], params=json.loads(row[-1]))
+            for row in self.conn.execute(sql, args)
+        ]
+
+    def get_latest(self, **filters):
+        runs = self.query(**filters)
+        return runs[0] if runs else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m results",
+        description="Browse the results store.",
+    )
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ls = commands.add_parser("list", help="List runs, newest first")
+    ls.add_argument("--model")
+    ls.add_argument("--workload")
+    ls.add_argument("--concurrency", type=int)
+    ls.add_argument("--git-rev")
+    ls.add_argument("--latest", action="store_true", help="Only the newest run of each configuration")
+
+    show = commands.add_parser("show", help="Print a run as JSON")
+    show.add_argument("id", type=int)
+    args = parser.parse_args(argv)
+
+    with ResultStore(args.db) as store:
+        if args.command == "show":
+            run = store.get_latest(run_id=args.id)
+            if run is None:
+                print(f"No run with id {args.id}")
+                return 1
+            print(json.dumps(run.load(), indent=4))
+            return 0
+
+        for run in store.query(
+            model=args.model,
+            workload=args.workload,
+            concurrency=args.concurrency,
+            git_rev=args.git_rev,
+            latest=args.latest,
+        ):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run.created_at))
+            print(
+                f"{run.id:>6}  {created}  {run.git_rev or '-':<14}{run.model:<32}"
+                f"{run.concurrency if run.concurrency is not None else '-':>6}"
+                f"{run.elapsed_seconds or 0:>10.2f}s  {run.name}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,88 @@
-import time
-import json
+import inspect
 import os
+import sys
+import time
 from functools import wraps
 from dataclasses import dataclass, asdict, field
 
 import psutil
 
+import loop_monitor
+from allocations import AllocationSupervisor
+from contention import ContentionSupervisor
 from cpu import CpuSupervisor, CpuUsage
 from memory import MemoryUsage, MemorySupervisor
+from profiler import StackProfiler, write_folded
+from results import DB_PATH, ResultStore, get_concurrency
+from sampler import ProcessSampler
+from stats import summarize_trials
+
+
+@dataclass(frozen=True)
+class RunOptions:
+    # "thread": supervisors run as threads of the measured process
+    # "process": a separate sampler process watches the measured process
+    sampling: str = "thread"
+    sampling_interval: float = 0.5
+    # runs executed first and thrown away
+    warmup_runs: int = 0
+    # measured runs, summarised when more than one
+    trials: int = 1
+    # pause after every run so the host settles before the next one
+    cooldown_seconds: float = 0
+    confidence: float = 0.95
+    # watch the event loops the asyncio models run, see loop_monitor.py
+    loop_monitor: bool = False
+    loop_probe_interval: float = 0.005
+    slow_callback_seconds: float = 0.01
+    # context switches, per thread CPU against wall time and lock waits,
+    # see contention.py
+    contention: bool = False
+    contention_interval: float = 0.05
+    # sys.setswitchinterval for the run, how long a thread holds the GIL
+    # before being asked to hand it over. None keeps the interpreter's (5ms)
+    switch_interval: float|None = None
+    # stack samples per second of every thread, 0 to not profile, see
+    # profiler.py. idle keeps the samples of threads not using the CPU
+    profile_rate: float = 0
+    profile_idle: bool = False
+    # trace Python allocations with tracemalloc keeping this many frames of
+    # each, 0 to not trace, see allocations.py
+    tracemalloc_frames: int = 0
+    tracemalloc_interval: float = 0.5
+
+    def __post_init__(self):
+        if self.profile_rate and self.sampling != "thread":
+            # stacks can only be taken from inside the measured process
+            raise ValueError("profile_rate needs sampling=\"thread\"")
+
+
+# RunOptions fields changing how the model runs or what its run costs, the
+# baseline runs the plots and speedups compare keep their defaults
+INSTRUMENTATION_OPTIONS = (
+    "sampling",
+    "sampling_interval",
+    "loop_monitor",
+    "contention",
+    "switch_interval",
+    "profile_rate",
+    "tracemalloc_frames",
+)
+
+
+def get_baseline_params(**params):
+    """
+    ResultStore.query params filters of runs with the default run options,
+    those program_runner stores under "run_options", merged with params.
+    """
+    defaults = RunOptions()
+    return {
+        **{
+            f"run_options.{option}": getattr(defaults, option)
+            for option in INSTRUMENTATION_OPTIONS
+        },
+        **params,
+    }
 
 
 @dataclass(frozen=True)
@@ -19,9 +94,21 @@ class Metrics:
     download_speed_per_s: float|None = field(default=None)
     total_upload: int|None = field(default=None)
     upload_speed_per_s: float|None = field(default=None)
+    model_metrics: dict = field(default_factory=dict)
+    sampling: dict = field(default_factory=dict)
+    switch_interval: float|None = field(default=None)
+    profile: dict|None = field(default=None)
     description: str = field(default="")
 
 
+_model_metrics = {}
+
+
+def report_metric(name, value):
+    # lets a model attach its own measurements to the run Metrics
+    _model_metrics[name] = value
+
+
 def network_usage_recorder(fn):
     @wraps(fn)
     def recorder(*arg, **kwargs):
@@ -47,10 +134,49 @@ def network_usage_recorder(fn):
     return recorder
 
 
+def add_sampling_data(data, options: RunOptions, cpu_seconds: float):
+    sampling = data.get("sampling", {})
+    return {
+        **data,
+        "sampling": {
+            "mode": options.sampling,
+            "interval": options.sampling_interval,
+            "sampler_cpu_seconds": sampling.get("sampler_cpu_seconds", 0) + cpu_seconds,
+        }
+    }
+
+
+def process_sampler_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        options = kwargs.get("run_options", RunOptions())
+        if options.sampling != "process":
+            return fn(*arg, **kwargs)
+
+        sampler = ProcessSampler(interval=options.sampling_interval)
+        sampler.start()
+
+        data, result = fn(*arg, **kwargs)
+
+        sampler.stop()
+
+        data = {
+            **data,
+            "cpu": sampler.get_cpu_usage(),
+            "memory": sampler.get_memory_usage(),
+        }
+        return add_sampling_data(data, options, sampler.sampler_cpu_seconds), result
+    return recorder
+
+
 def memory_usage_recorder(fn):
     @wraps(fn)
     def recorder(*arg, **kwargs):
-        supervisor = MemorySupervisor()
+        options = kwargs.get("run_options", RunOptions())
+        if options.sampling != "thread":
+            return fn(*arg, **kwargs)
+
+        supervisor = MemorySupervisor(interval=options.sampling_interval)
         supervisor.start()
 
         data, result = fn(*arg, **kwargs)
@@ -62,14 +188,25 @@ def memory_usage_recorder(fn):
             **data,
             "memory": supervisor.get_usage()
         }
-        return data, result
+        return add_sampling_data(data, options, supervisor.cpu_seconds), result
     return recorder
 
 
 def cpu_usage_recorder(fn):
     @wraps(fn)
     def recorder(*arg, **kwargs):
-        supervisor = CpuSupervisor()
+        options = kwargs.get("run_options", RunOptions())
+        if options.sampling != "thread":
+            return fn(*arg, **kwargs)
+
+        profiler = None
+        if options.profile_rate:
+            profiler = StackProfiler(
+                options.profile_rate,
+                options.profile_idle,
+                root=inspect.unwrap(execute).__code__,
+            )
+        supervisor = CpuSupervisor(interval=options.sampling_interval, profiler=profiler)
         supervisor.start()
 
         data, result = fn(*arg, **kwargs)
@@ -81,7 +218,9 @@ def cpu_usage_recorder(fn):
             **data,
             "cpu": supervisor.get_usage()
         }
-        return data, result
+        if profiler is not None:
+            data["profile"] = profiler.get_usage()
+        return add_sampling_data(data, options, supervisor.cpu_seconds), result
     return recorder
 
 
@@ -100,29 +239,213 @@ def elapsed_time_recorder(fn):
     return recorder
 
 
+def model_metrics_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        _model_metrics.clear()
+
+        data, result = fn(*arg, **kwargs)
+
+        data = {
+            **data,
+            "model_metrics": dict(_model_metrics)
+        }
+        return data, result
+    return recorder
+
+
+def loop_monitor_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        options = kwargs.get("run_options", RunOptions())
+        if not options.loop_monitor:
+            return fn(*arg, **kwargs)
+
+        loop_monitor.enable(
+            probe_interval=options.loop_probe_interval,
+            slow_callback_threshold=options.slow_callback_seconds,
+        )
+        try:
+            data, result = fn(*arg, **kwargs)
+        finally:
+            usages = loop_monitor.disable()
+        # one entry per loop, the thread and process models run several
+        report_metric("loops", usages)
+        return data, result
+    return recorder
+
+
+def contention_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        options = kwargs.get("run_options", RunOptions())
+        if not options.contention:
+            return fn(*arg, **kwargs)
+
+        supervisor = ContentionSupervisor(interval=options.contention_interval)
+        supervisor.start()
+        try:
+            data, result = fn(*arg, **kwargs)
+        finally:
+            supervisor.stop_checking()
+            supervisor.join()
+
+        report_metric("contention", supervisor.get_usage())
+        return data, result
+    return recorder
+
+
+def allocation_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        options = kwargs.get("run_options", RunOptions())
+        if not options.tracemalloc_frames:
+            return fn(*arg, **kwargs)
+
+        supervisor = AllocationSupervisor(
+            interval=options.tracemalloc_interval,
+            frame_depth=options.tracemalloc_frames,
+        )
+        supervisor.start()
+        try:
+            data, result = fn(*arg, **kwargs)
+        finally:
+            supervisor.stop_checking()
+            supervisor.join()
+            supervisor.finish()
+
+        report_metric("allocations", supervisor.get_usage())
+        return data, result
+    return recorder
+
+
+def switch_interval_recorder(fn):
+    @wraps(fn)
+    def recorder(*arg, **kwargs):
+        options = kwargs.get("run_options", RunOptions())
+        previous = sys.getswitchinterval()
+        if options.switch_interval is not None:
+            sys.setswitchinterval(options.switch_interval)
+        try:
+            data, result = fn(*arg, **kwargs)
+            # the interval in effect, the interpreter rounds the one asked
+            data = {**data, "switch_interval": sys.getswitchinterval()}
+        finally:
+            sys.setswitchinterval(previous)
+        return data, result
+    return recorder
+
+
+@switch_interval_recorder
 @network_usage_recorder
+@process_sampler_recorder
 @cpu_usage_recorder
 @memory_usage_recorder
+@model_metrics_recorder
+@contention_recorder
+@loop_monitor_recorder
+@allocation_recorder
 @elapsed_time_recorder
-def execute(fn, **kwargs):
+def execute(fn, run_options: RunOptions = RunOptions(), **kwargs):
     result = fn(**kwargs)
     return {}, result
 
 
-def program_runner(fn, name, dir_name, *, descr="",  **kwargs):
-    metric_data, result =  execute(fn, **kwargs)
+def get_params(fn, kwargs: dict):
+    # the arguments the model runs with, defaults included
+    params = {
+        p.name: p.default
+        for p in inspect.signature(fn).parameters.values()
+        if p.default is not p.empty
+    }
+    params.update(kwargs)
+    return params
 
-    data = Metrics(
-        **metric_data,
-        description=descr,
-    )
 
-    data = asdict(data)
-    data["returned_value(s)"] = result
-    
-    os.makedirs(f"{dir_name}/json", exist_ok=True)
-    with open(f"{dir_name}/json/{name}.json", "w") as f:
-        json.dump(data, f, indent=4)
+def get_model_name(fn):
+    # "io-bound.thread" whether the model is imported or run with python -m
+    module = fn.__module__
+    if module == "__main__":
+        spec = getattr(sys.modules["__main__"], "__spec__", None)
+        module = spec.name if spec is not None else fn.__name__
+    return module
+
+
+def program_runner(
+    fn,
+    name,
+    dir_name,
+    *,
+    descr="",
+    run_options: RunOptions = RunOptions(),
+    model: str|None = None,
+    concurrency: int|None = None,
+    store: ResultStore|None = None,
+    **kwargs
+):
+    params = get_params(fn, kwargs)
+    results_path = store.path if store is not None else DB_PATH
+    # setup a model wants kept out of its measured runs, like building the
+    # input it reads or looking up a baseline in the store the run goes to
+    prepare = getattr(inspect.getmodule(fn), "prepare", None)
+    if prepare is not None:
+        prepare(results_path=results_path, **params)
+
+    for i in range(run_options.warmup_runs):
+        print(f"Warm-up run {i + 1}/{run_options.warmup_runs}")
+        execute(fn, run_options=run_options, **kwargs)
+        time.sleep(run_options.cooldown_seconds)
+
+    model = model or get_model_name(fn)
+    started = time.strftime("%Y%m%d-%H%M%S")
+    trials = []
+    for i in range(run_options.trials):
+        if run_options.trials > 1:
+            print(f"Trial {i + 1}/{run_options.trials}")
+        metric_data, result =  execute(fn, run_options=run_options, **kwargs)
+        if metric_data.get("profile") is not None:
+            # folded stacks are too big for the run document, they are
+            # written next to the results store
+            metric_data["profile"] = write_folded(
+                metric_data["profile"],
+                os.path.join(
+                    os.path.dirname(os.path.abspath(results_path)),
+                    "profiles",
+                    model,
+                    f"{name}_{started}_trial_{i + 1}",
+                ),
+            )
+
+        trial = asdict(Metrics(
+            **metric_data,
+            description=descr,
+        ))
+        trial["returned_value(s)"] = result
+        trials.append(trial)
+        time.sleep(run_options.cooldown_seconds)
+
+    # the trial with the median elapsed time stands for the configuration
+    by_elapsed = sorted(trials, key=lambda t: t["elapsed_seconds"])
+    data = dict(by_elapsed[(len(by_elapsed) - 1) // 2])
+    result = data["returned_value(s)"]
+    if len(trials) > 1:
+        data["trials"] = trials
+        data["summary"] = summarize_trials(trials, run_options.confidence)
+
+    # not model arguments, but runs only differing by them are not the same
+    # configuration
+    params["run_options"] = asdict(run_options)
+    run = dict(
+        model=model,
+        workload=dir_name,
+        concurrency=concurrency if concurrency is not None else get_concurrency(params),
+        params=params,
+    )
+    if store is not None:
+        store.add_run(name, data, **run)
+    else:
+        with ResultStore() as store:
+            store.add_run(name, data, **run)
 
     return data, result
 
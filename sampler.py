@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import psutil
+
+from cpu import CpuUsage
+from memory import MemoryUsage
+
+# shared memory layout, all float64:
+# [stop flag, ready flag, sample count, sys cpu..., proc cpu..., rss...]
+_HEADER = 3
+_SERIES = 3
+
+
+def _views(shm: shared_memory.SharedMemory, capacity: int):
+    values = shm.buf.cast("d")
+    return (
+        values,
+        values[_HEADER:_HEADER + capacity],
+        values[_HEADER + capacity:_HEADER + 2 * capacity],
+        values[_HEADER + 2 * capacity:_HEADER + 3 * capacity],
+    )
+
+
+def sample(pid: int, shm_name: str, capacity: int, interval: float):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # the segment belongs to the parent, do not let this process unlink it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    values, sys_usage, proc_usage, rss_usage = _views(shm, capacity)
+
+    target = psutil.Process(pid)
+    # processes already running (like this sampler or the local bench
+    # server) are not part of the measured program
+    ignored = {p.pid for p in target.children(recursive=True)}
+    procs = {pid: target}
+    psutil.cpu_percent(interval=None)
+    target.cpu_percent(interval=None)
+    values[1] = 1
+
+    count = 0
+    next_tick = time.perf_counter() + interval
+    try:
+        while not values[0] and count < capacity:
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+            next_tick += interval
+
+            try:
+                for child in target.children(recursive=True):
+                    if child.pid not in ignored and child.pid not in procs:
+                        child.cpu_percent(interval=None)
+                        procs[child.pid] = child
+            except psutil.Error:
+                break
+
+            cpu = rss = 0.0
+            for child_pid, proc in list(procs.items()):
+                try:
+                    with proc.oneshot():
+                        cpu += proc.cpu_percent()
+                        rss += proc.memory_info().rss
+                except psutil.Error:
+                    del procs[child_pid]
+
+            sys_usage[count] = psutil.cpu_percent()
+            proc_usage[count] = cpu
+            rss_usage[count] = rss
+            count += 1
+            values[2] = count
+    finally:
+        del values, sys_usage, proc_usage, rss_usage
+        shm.close()
+
+
+class ProcessSampler:
+    """
+    Samples the CPU and memory usage of `pid` and its children from a
+    separate process, so the sampling does not compete for the GIL with the
+    measured workload. Samples are stored in shared memory.
+    """
+
+    def __init__(self, pid: int|None = None, interval=0.01, capacity=360_000) -> None:
+        self._pid = pid or os.getpid()
+        self._interval = interval
+        self._capacity = capacity
+        self._shm = None
+        self._proc = None
+        self.sys_usage: list[float] = []
+        self.proc_usage: list[float] = []
+        self.rss_usage: list[int] = []
+        self.sampler_cpu_seconds = 0.0
+
+    def start(self):
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=8 * (_HEADER + _SERIES * self._capacity)
+        )
+        self._shm.buf[:8 * _HEADER] = bytes(8 * _HEADER)
+        self._proc = subprocess.Popen([
+            sys.executable,
+            os.path.abspath(__file__),
+            str(self._pid),
+            self._shm.name,
+            str(self._capacity),
+            str(self._interval),
+        ])
+        self._ps_proc = psutil.Process(self._proc.pid)
+
+        values = self._shm.buf.cast("d")
+        while not values[1] and self._proc.poll() is None:
+            time.sleep(0.001)
+        del values
+
+    def stop(self):
+        values, sys_usage, proc_usage, rss_usage = _views(self._shm, self._capacity)
+        try:
+            cpu_times = self._ps_proc.cpu_times()
+            self.sampler_cpu_seconds = cpu_times.user + cpu_times.system
+        except psutil.Error:
+            pass
+        values[0] = 1
+        self._proc.wait()
+
+        count = int(values[2])
+        self.sys_usage = sys_usage[:count].tolist()
+        self.proc_usage = proc_usage[:count].tolist()
+        self.rss_usage = [int(v) for v in rss_usage[:count]]
+
+        del values, sys_usage, proc_usage, rss_usage
+        self._shm.close()
+        self._shm.unlink()
+
+    def get_cpu_usage(self):
+        return CpuUsage(
+            sys_average_usage=sum(self.sys_usage) / len(self.sys_usage),
+            sys_max_usage=max(self.sys_usage),
+            sys_min_usage=min(self.sys_usage),
+            sys_usage=self.sys_usage,
+            proc_average_usage=sum(self.proc_usage) / len(self.proc_usage),
+            proc_max_usage=max(self.proc_usage),
+            proc_min_usage=min(self.proc_usage),
+            proc_usage=self.proc_usage,
+            recording_interval=self._interval,
+        )
+
+    def get_memory_usage(self):
+        return MemoryUsage(
+            max_usage=max(self.rss_usage),
+            min_usage=min(self.rss_usage),
+            average_usage=sum(self.rss_usage) / len(self.rss_usage),
+            usage=self.rss_usage,
+            recording_interval=self._interval,
+        )
+
+
+if __name__ == "__main__":
+    pid, shm_name, capacity, interval = sys.argv[1:]
+    sample(int(pid), shm_name, int(capacity), float(interval))
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import socket
+import multiprocessing
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit, parse_qsl
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 0
+    workers: int = os.cpu_count() or 1
+    # fixed:<s> | uniform:<min>,<max> | exp:<mean> | lognormal:<median>,<sigma>
+    # | wave:<low>,<high>,<period> | step:<low>,<high>,<period>
+    delay: str = "fixed:0"
+    # minimum size in bytes of the response body, padded in the `data` field
+    body_size: int = 0
+    chunked: bool = False
+    chunk_size: int = 4096
+    error_rate: float = 0.0
+    reset_rate: float = 0.0
+    # requests a worker serves at once, the ones above get a 503, 0 for no limit
+    capacity: int = 0
+
+    @classmethod
+    def from_env(cls, **overrides):
+        env = {
+            "workers": ("BENCH_SERVER_WORKERS", int),
+            "delay": ("BENCH_SERVER_DELAY", str),
+            "body_size": ("BENCH_SERVER_BODY_SIZE", int),
+            "chunked": ("BENCH_SERVER_CHUNKED", lambda v: v == "1"),
+            "error_rate": ("BENCH_SERVER_ERROR_RATE", float),
+            "reset_rate": ("BENCH_SERVER_RESET_RATE", float),
+            "capacity": ("BENCH_SERVER_CAPACITY", int),
+        }
+        kwargs = {
+            key: cast(os.environ[name])
+            for key, (name, cast) in env.items()
+            if name in os.environ
+        }
+        return cls(**{**kwargs, **overrides})
+
+
+def make_delay(spec: str):
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+
+    if kind == "fixed":
+        return lambda: values[0] if values else 0
+    if kind == "uniform":
+        low, high = values
+        return lambda: random.uniform(low, high)
+    if kind == "exp":
+        mean, = values
+        return lambda: random.expovariate(1 / mean)
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    # the time varying ones follow the wall clock so every worker is in phase
+    if kind == "wave":
+        low, high, period = values
+        return lambda: low + (high - low) * (1 - math.cos(2 * math.pi * time.time() / period)) / 2
+    if kind == "step":
+        low, high, period = values
+        return lambda: high if time.time() % period >= period / 2 else low
+    raise ValueError(f"Unknown delay distribution: {spec}")
+
+
+def build_body(method, target, headers, host, config: ServerConfig):
+    split = urlsplit(target)
+    body = {
+        "args": dict(parse_qsl(split.query)),
+        "data": "",
+        "files": {},
+        "form": {},
+        "headers": headers,
+        "json": None,
+        "method": method,
+        "origin": "127.0.0.1",
+        "url": f"http://{host}{target}",
+    }
+    payload = json.dumps(body, indent=2).encode()
+    if len(payload) < config.body_size:
+        body["data"] = "x" * (config.body_size - len(payload))
+        payload = json.dumps(body, indent=2).encode()
+    return payload + b"\n"
+
+
+def build_response(status: int, reason: str, body: bytes, config: ServerConfig):
+    head = [
+        f"HTTP/1.1 {status} {reason}",
+        "Content-Type: application/json",
+        "Access-Control-Allow-Origin: *",
+    ]
+    if config.chunked:
+        head.append("Transfer-Encoding: chunked")
+        chunks = []
+        for i in range(0, len(body), config.chunk_size):
+            chunk = body[i:i + config.chunk_size]
+            chunks.append(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        chunks.append(b"0\r\n\r\n")
+        return ("\r\n".join(head) + "\r\n\r\n").encode() + b"".join(chunks)
+
+    head.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """(method, target, version, headers) of the next request, None once the client is gone."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+
+    request_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+    method, target, version = request_line.split(" ", 2)
+    headers = {}
+    for line in header_lines:
+        key, _, value = line.partition(":")
+        headers[key.strip().title()] = value.strip()
+
+    content_length = int(headers.get("Content-Length", 0))
+    if content_length:
+        try:
+            await reader.readexactly(content_length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+    return method, target, version, headers
+
+
+async def build_reply(method, target, headers, config: ServerConfig, get_delay, load: dict):
+    overloaded = config.capacity and load["in_flight"] >= config.capacity
+    if not overloaded:
+        load["in_flight"] += 1
+        try:
+            delay = get_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        finally:
+            load["in_flight"] -= 1
+
+    if overloaded:
+        # shed the load like an overloaded server would
+        return build_response(503, "Service Unavailable", b"", config)
+    if config.error_rate and random.random() < config.error_rate:
+        return build_response(500, "Internal Server Error", b"", config)
+    if not target.startswith("/anything"):
+        return build_response(404, "Not Found", b"", config)
+    body = build_body(method, target, headers, headers.get("Host", ""), config)
+    return build_response(200, "OK", body, config)
+
+
+async def send_replies(writer: asyncio.StreamWriter, replies: asyncio.Queue):
+    # replies are tasks queued in request order, written in that order
+    # whatever order they finish in
+    try:
+        while (reply := await replies.get()) is not None:
+            writer.write(await reply)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        while not replies.empty():
+            reply = replies.get_nowait()
+            if reply is not None:
+                reply.cancel()
+        writer.close()
+
+
+async def handle_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    config: ServerConfig,
+    get_delay,
+    load: dict,
+):
+    # asyncio only disables Nagle on sockets created with IPPROTO_TCP, not
+    # on the ones accepted here, pipelined replies would wait on delayed acks
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # pipelined requests are handled concurrently, like separate
+    # connections would be, only their responses wait on each other
+    replies = asyncio.Queue()
+    sender = asyncio.create_task(send_replies(writer, replies))
+    try:
+        while (request := await read_request(reader)) is not None:
+            method, target, version, headers = request
+
+            if config.reset_rate and random.random() < config.reset_rate:
+                writer.transport.abort()
+                sender.cancel()
+                break
+
+            replies.put_nowait(asyncio.create_task(
+                build_reply(method, target, headers, config, get_delay, load)
+            ))
+
+            keep_alive = version == "HTTP/1.1"
+            if headers.get("Connection", "").lower() == "close":
+                keep_alive = False
+            if not keep_alive:
+                break
+    finally:
+        replies.put_nowait(None)
+        # a sender cancelled by a reset is not an error of this handler
+        await asyncio.gather(sender, return_exceptions=True)
+
+
+def serve(sock: socket.socket, config: ServerConfig):
+    get_delay = make_delay(config.delay)
+    # requests of this worker currently in their delay
+    load = {"in_flight": 0}
+
+    async def run():
+        server = await asyncio.start_server(
+            lambda r, w: handle_connection(r, w, config, get_delay, load),
+            sock=sock,
+        )
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+class BenchServer:
+    def __init__(self, config: ServerConfig|None = None) -> None:
+        self.config = config or ServerConfig.from_env()
+        self._processes: list[multiprocessing.Process] = []
+        self._sock = None
+
+    @property
+    def address(self):
+        host, port = self._sock.getsockname()[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        # the socket is bound once and shared by every worker process
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.config.host, self.config.port))
+        self._sock.listen(4096)
+
+        ctx = multiprocessing.get_context("fork")
+        for _ in range(self.config.workers):
+            p = ctx.Process(
+                target=serve, args=(self._sock, self.config), daemon=True
+            )
+            p.start()
+            self._processes.append(p)
+        return self.address
+
+    def stop(self):
+        for p in self._processes:
+            p.terminate()
+        for p in self._processes:
+            p.join()
+        self._processes = []
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+@contextmanager
+def bench_server(config: ServerConfig|None = None):
+    """Start the local server unless BENCH_SERVER_URL points to an external one."""
+    if os.getenv("BENCH_SERVER_URL") is not None:
+        yield os.environ["BENCH_SERVER_URL"]
+        return
+
+    server = BenchServer(config)
+    address = server.start()
+    os.environ["BENCH_SERVER_URL"] = address
+    print("Local bench server started on", address)
+    try:
+        yield address
+    finally:
+        del os.environ["BENCH_SERVER_URL"]
+        server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local httpbin stand-in for the IO bound benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--delay", default="fixed:0")
+    parser.add_argument("--body-size", type=int, default=0)
+    parser.add_argument("--chunked", action="store_true")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--reset-rate", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0)
+    args = parser.parse_args()
+
+    server = BenchServer(ServerConfig(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        delay=args.delay,
+        body_size=args.body_size,
+        chunked=args.chunked,
+        error_rate=args.error_rate,
+        reset_rate=args.reset_rate,
+        capacity=args.capacity,
+    ))
+    print("Serving on", server.start())
+    try:
+        for p in server._processes:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
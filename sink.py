@@ -0,0 +1,356 @@
+import asyncio
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import time
+from threading import Thread, get_ident
+from queue import Queue, Empty
+from dataclasses import dataclass, field
+
+from aiofile import async_open
+
+from contention import make_lock
+
+CHUNK_SIZE = 64 * 1024
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+
+@dataclass(frozen=True)
+class SinkUsage:
+    kind: str
+    total_bytes: int
+    write_count: int
+    write_seconds: float
+    lock_wait_seconds: float
+    write_syscalls: int
+    checksum: str|None = field(default=None)
+    meaning: dict = field(default_factory=lambda: {
+        "kind": "Where the response bodies were written",
+        "write_count": "Number of write calls received by the sink",
+        "write_seconds": "Time in second spent inside the sink, summed over all writers",
+        "lock_wait_seconds": "Time in second writers spent waiting to hand their data to the sink (lock or full queue), summed over all writers",
+        "write_syscalls": "Number of write system calls issued to the underlying file",
+    })
+
+
+class Sink:
+    kind = ""
+
+    def __init__(self) -> None:
+        self.total_bytes = 0
+        self.write_count = 0
+        self.write_seconds = 0.0
+        self.lock_wait_seconds = 0.0
+        self._lock = make_lock("sink")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
+
+    def _write(self, data) -> None:
+        pass
+
+    def write(self, data) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            acquired = time.perf_counter()
+            self._write(data)
+            self.total_bytes += len(data)
+            self.write_count += 1
+            self.lock_wait_seconds += acquired - start
+            self.write_seconds += time.perf_counter() - start
+
+    async def awrite(self, data) -> None:
+        self.write(data)
+
+    def close(self) -> None:
+        pass
+
+    def get_checksum(self) -> str|None:
+        return None
+
+    def get_write_syscalls(self) -> int:
+        return 0
+
+    def get_usage(self):
+        return SinkUsage(
+            kind=self.kind,
+            total_bytes=self.total_bytes,
+            write_count=self.write_count,
+            write_seconds=self.write_seconds,
+            lock_wait_seconds=self.lock_wait_seconds,
+            write_syscalls=self.get_write_syscalls(),
+            checksum=self.get_checksum(),
+        )
+
+
+class _CountingFileIO(io.FileIO):
+    syscalls = 0
+
+    def write(self, b):
+        self.syscalls += 1
+        return super().write(b)
+
+
+def new_temp_fd():
+    fd, name = tempfile.mkstemp()
+    os.unlink(name)
+    return fd
+
+
+class NullSink(Sink):
+    kind = "null"
+
+
+class HashSink(Sink):
+    kind = "hash"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._hash = hashlib.blake2b()
+
+    def _write(self, data) -> None:
+        self._hash.update(data)
+
+    def get_checksum(self):
+        return self._hash.hexdigest()
+
+
+class FileSink(Sink):
+    kind = "file"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._raw = _CountingFileIO(new_temp_fd(), "ab")
+        self._f = io.BufferedWriter(self._raw)
+
+    def _write(self, data) -> None:
+        self._f.write(data)
+
+    def close(self) -> None:
+        self._f.flush()
+        self._f.close()
+
+    def get_write_syscalls(self):
+        return self._raw.syscalls
+
+
+class CoalescingSink(Sink):
+    """
+    Writers only enqueue their data, a single writer thread (or task when
+    opened with `async with`) flushes it to the file with os.writev once
+    `batch_size` bytes are pending or `max_delay` seconds have passed.
+    """
+    kind = "coalesce"
+
+    def __init__(self, batch_size=1024 * 1024, max_delay=0.05, queue_size=4096) -> None:
+        super().__init__()
+        self._fd = new_temp_fd()
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._queue_size = queue_size
+        self._syscalls = 0
+        # per writer thread queue wait, merged on read
+        self._waits: dict[int, float] = {}
+        self._q = None
+        self._writer = None
+        self._task = None
+
+    def __enter__(self):
+        self._q = Queue(maxsize=self._queue_size)
+        self._writer = Thread(target=self._run, daemon=True)
+        self._writer.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._q.put(None)
+        self._writer.join()
+        self.close()
+
+    async def __aenter__(self):
+        self._q = asyncio.Queue(maxsize=self._queue_size)
+        self._task = asyncio.create_task(self._arun())
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._q.put(None)
+        await self._task
+        self.close()
+
+    def write(self, data) -> None:
+        start = time.perf_counter()
+        # the buffer may be reused by the caller once write returns
+        self._q.put(bytes(data))
+        ident = get_ident()
+        self._waits[ident] = self._waits.get(ident, 0.0) + time.perf_counter() - start
+
+    async def awrite(self, data) -> None:
+        if self._task is None:
+            self.write(data)
+            return
+        start = time.perf_counter()
+        await self._q.put(bytes(data))
+        self.lock_wait_seconds += time.perf_counter() - start
+
+    def _flush(self, batch:list) -> None:
+        start = time.perf_counter()
+        self.total_bytes += sum(len(b) for b in batch)
+        self.write_count += len(batch)
+        while batch:
+            written = os.writev(self._fd, batch[:IOV_MAX])
+            self._syscalls += 1
+            while batch and written >= len(batch[0]):
+                written -= len(batch[0])
+                batch.pop(0)
+            if batch and written:
+                batch[0] = batch[0][written:]
+        self.write_seconds += time.perf_counter() - start
+
+    def _run(self) -> None:
+        batch, size, deadline = [], 0, 0.0
+        while 1:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                data = self._q.get(timeout=timeout)
+            except Empty:
+                data = b""
+            if data:
+                if not batch:
+                    deadline = time.monotonic() + self._max_delay
+                batch.append(data)
+                size += len(data)
+            if data is None or size >= self._batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch, size = [], 0
+            if data is None:
+                break
+
+    async def _arun(self) -> None:
+        batch, size, deadline = [], 0, 0.0
+        while 1:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                data = await asyncio.wait_for(self._q.get(), timeout)
+            except asyncio.TimeoutError:
+                data = b""
+            if data:
+                if not batch:
+                    deadline = time.monotonic() + self._max_delay
+                batch.append(data)
+                size += len(data)
+            if data is None or size >= self._batch_size or (batch and time.monotonic() >= deadline):
+                # the writev runs off the loop while the next batch fills up
+                await asyncio.to_thread(self._flush, batch)
+                batch, size = [], 0
+            if data is None:
+                break
+
+    def close(self) -> None:
+        self.lock_wait_seconds += sum(self._waits.values())
+        os.close(self._fd)
+
+    def get_write_syscalls(self):
+        return self._syscalls
+
+
+class MmapRingSink(Sink):
+    kind = "mmap"
+
+    def __init__(self, size=64 * 1024 * 1024) -> None:
+        super().__init__()
+        self._f = tempfile.TemporaryFile()
+        self._f.truncate(size)
+        self._map = mmap.mmap(self._f.fileno(), size)
+        self._size = size
+        self._offset = 0
+
+    def _write(self, data) -> None:
+        data = memoryview(data).cast("B")
+        while data:
+            n = min(len(data), self._size - self._offset)
+            self._map[self._offset:self._offset + n] = data[:n]
+            self._offset = (self._offset + n) % self._size
+            data = data[n:]
+
+    def close(self) -> None:
+        self._map.close()
+        self._f.close()
+
+
+class AioFileSink(Sink):
+    kind = "aiofile"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._name = os.path.join(tempfile.gettempdir(), f"data-{os.getpid()}")
+        self._af = None
+
+    def __enter__(self):
+        raise TypeError("The aiofile sink can only be used with `async with`")
+
+    async def __aenter__(self):
+        self._af = await async_open(self._name, "ab+").__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._af.flush()
+        await self._af.close()
+        os.unlink(self._name)
+
+    def write(self, data) -> None:
+        raise TypeError("The aiofile sink can only be written from its event loop")
+
+    async def awrite(self, data) -> None:
+        start = time.perf_counter()
+        await self._af.write(bytes(data))
+        self.total_bytes += len(data)
+        self.write_count += 1
+        self.write_seconds += time.perf_counter() - start
+
+    def get_write_syscalls(self):
+        return self.write_count
+
+
+SINKS = {
+    sink.kind: sink
+    for sink in [
+        NullSink, HashSink, FileSink, CoalescingSink, MmapRingSink, AioFileSink
+    ]
+}
+
+
+def open_sink(kind="file", **kwargs) -> Sink:
+    try:
+        return SINKS[kind](**kwargs)
+    except KeyError:
+        raise ValueError(
+            f"Unknown sink {kind!r}, choose one of: {', '.join(SINKS)}"
+        ) from None
+
+
+def new_buffer(size=CHUNK_SIZE):
+    return memoryview(bytearray(size))
+
+
+def write_response_into(response, write, buffer:memoryview):
+    # requests response opened with stream=True, the body is read straight
+    # into the preallocated buffer and handed to write chunk by chunk
+    raw = response.raw
+    raw.decode_content = True
+    while n := raw.readinto(buffer):
+        write(buffer[:n])
+
+
+async def write_response_chunks(response, write, chunk_size=CHUNK_SIZE):
+    async for chunk in response.content.iter_chunked(chunk_size):
+        await write(chunk)
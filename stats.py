@@ -0,0 +1,70 @@
+import random
+import statistics
+
+# dotted paths into the run data summarised across trials, missing ones are skipped
+SUMMARY_METRICS = [
+    "elapsed_seconds",
+    "download_speed_per_s",
+    "cpu.proc_average_usage",
+    "cpu.proc_max_usage",
+    "memory.average_usage",
+    "memory.max_usage",
+    "model_metrics.latency.total.p50_seconds",
+    "model_metrics.latency.total.p99_seconds",
+]
+
+
+def get_path(data: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def bootstrap_ci(values: list[float], confidence=0.95, resamples=2000, seed=0):
+    # percentile bootstrap of the mean, seeded so reruns give the same interval
+    rng = random.Random(seed)
+    means = sorted(
+        statistics.fmean(rng.choices(values, k=len(values)))
+        for _ in range(resamples)
+    )
+    tail = (1 - confidence) / 2
+    return means[int(tail * (resamples - 1))], means[int((1 - tail) * (resamples - 1))]
+
+
+def find_outliers(values: list[float], k=1.5):
+    # Tukey fences, indexes of the values out of [q1 - k*iqr, q3 + k*iqr]
+    if len(values) < 4:
+        return []
+    q1, _, q3 = statistics.quantiles(values, n=4)
+    iqr = q3 - q1
+    return [
+        i for i, v in enumerate(values)
+        if v < q1 - k * iqr or v > q3 + k * iqr
+    ]
+
+
+def summarize(values: list[float], confidence=0.95):
+    ci_low, ci_high = bootstrap_ci(values, confidence)
+    return {
+        "mean": statistics.fmean(values),
+        "median": statistics.median(values),
+        "stddev": statistics.stdev(values) if len(values) > 1 else 0.0,
+        "min": min(values),
+        "max": max(values),
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "confidence": confidence,
+        "outliers": find_outliers(values),
+    }
+
+
+def summarize_trials(trials: list[dict], confidence=0.95):
+    summary = {}
+    for path in SUMMARY_METRICS:
+        values = [get_path(trial, path) for trial in trials]
+        if any(v is None for v in values):
+            continue
+        summary[path] = summarize(values, confidence)
+    return summary